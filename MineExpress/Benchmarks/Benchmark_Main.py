@@ -0,0 +1,191 @@
+import argparse, json, time, platform, sys, traceback
+import numpy as np
+
+from MineExpressEnvSimulator.MineExpressSimulator import MineExpressSimulator
+from TrainingRunner import QTableAgent
+import PathPlanning
+
+BENCHMARKS = {}
+
+
+def benchmark(name, unit, higher_is_better=True):
+    def register(function):
+        BENCHMARKS[name] = (function, unit, higher_is_better)
+        return function
+    return register
+
+
+def measure(function, min_time):
+    """
+    Call function(n) with a growing n until one call takes at least min_time seconds,
+    return the number of operations per second of that call.
+    """
+    n = 1
+    while True:
+        start = time.perf_counter()
+        function(n)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return n / elapsed
+        # Aim a little past min_time with the next call
+        n = max(2 * n, int(1.2 * n * min_time / max(elapsed, 1e-9)))
+
+
+@benchmark("simulator_step", "steps/s")
+def simulatorStep(min_time):
+    env = MineExpressSimulator(0)
+    env.reset()
+    actions = env.rng.integers(0, 4, 1 << 20)
+
+    def run(n):
+        for i in range(n):
+            env.step(actions[i & 0xFFFFF])
+    return measure(run, min_time)
+
+
+@benchmark("simulator_reset", "resets/s")
+def simulatorReset(min_time):
+    env = MineExpressSimulator(0)
+
+    def run(n):
+        for _ in range(n):
+            env.reset()
+    return measure(run, min_time)
+
+
+@benchmark("q_table_update", "updates/s")
+def qTableUpdate(min_time):
+    env = MineExpressSimulator(0)
+    agent = QTableAgent(env.state_num, env.action_num, 0.7, 0.618)
+    rng = np.random.default_rng(0)
+    transitions = np.stack([rng.integers(0, env.state_num, 1 << 16), rng.integers(0, env.action_num, 1 << 16),
+                            rng.integers(-4, 1, 1 << 16), rng.integers(0, env.state_num, 1 << 16)], axis=1).tolist()
+
+    def run(n):
+        for i in range(n):
+            state, action, reward, new_state = transitions[i & 0xFFFF]
+            agent.update(state, action, reward, new_state, False)
+    return measure(run, min_time)
+
+
+@benchmark("dqn_learn", "batches/s")
+def dqnLearn(min_time):
+    from MineExpressEnvSimulator.Deep_Q_Learning import DQN
+    dqn = DQN(500, 32, 50, 0.001, 0.618)
+    env = MineExpressSimulator(0)
+    state = env.reset()
+    for _ in range(dqn.memory_size):
+        action = int(env.rng.integers(env.action_num))
+        new_state, reward, done, _ = env.step(action)
+        dqn.storeStepInfo([state, action, reward, new_state, done])
+        state = env.reset() if done else new_state
+
+    def run(n):
+        for _ in range(n):
+            dqn.learn()
+    return measure(run, min_time)
+
+
+def arenaGrid(width, seed=0):
+    """
+    A width x width floor laid out like the MineExpress arena: emerald nodes on every
+    other cell joined by stone corridors, some of them soul_sand or blocked by grass.
+    """
+    rng = np.random.default_rng(seed)
+    grid = np.full((width, width), "grass", dtype=object)
+    grid[::2, :] = "stone"
+    grid[:, ::2] = "stone"
+    grid[::2, ::2] = "emerald_block"
+    corridor = (np.add.outer(np.arange(width), np.arange(width)) % 2) == 1
+    roll = rng.random((width, width))
+    grid[corridor & (roll < 0.15)] = "soul_sand"
+    grid[corridor & (roll > 0.95)] = "grass"
+    return grid.flatten().tolist()
+
+
+def dijkstraLatency(width, min_time):
+    grid = arenaGrid(width)
+    start, end = 0, width * width - 1
+
+    def run(n):
+        for _ in range(n):
+            PathPlanning.dijkstra_shortest_path(grid, start, end, width)
+    return 1000 / measure(run, min_time)
+
+
+for width in (81, 161, 321):
+    benchmark(f"dijkstra_{width}x{width}", "ms", higher_is_better=False)(
+        lambda min_time, width=width: dijkstraLatency(width, min_time))
+
+
+def runBenchmarks(names, min_time):
+    """
+    Run the named benchmarks, return their results and the names of the ones that raised.
+    A failing benchmark prints its traceback and the others still run.
+    """
+    results, failures = {}, []
+    for name in names:
+        function, unit, higher_is_better = BENCHMARKS[name]
+        try:
+            value = function(min_time)
+        except Exception:
+            print(f"{name}: failed")
+            traceback.print_exc()
+            failures.append(name)
+            continue
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"{name}: {value:.2f} {unit}")
+    return results, failures
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the change against a saved baseline, return the names that got worse by more
+    than tolerance.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], result["value"]
+        change = (new - old) / old if result["higher_is_better"] else (old - new) / old
+        print(f"{name}: {old:.2f} -> {new:.2f} {result['unit']} ({change:+.1%})")
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", type=str, nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--min_time", type=float, default=1.0)
+    parser.add_argument("--output", type=str, default="benchmark.json")
+    parser.add_argument("--baseline", type=str, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    config = parser.parse_args()
+
+    results, failures = runBenchmarks(config.only, config.min_time)
+    report = {
+        "time": time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(time.time())),
+        "machine": platform.platform(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results,
+        "failures": failures,
+    }
+    with open(config.output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    failed = bool(failures)
+    if failures:
+        print("Failed:", ", ".join(failures))
+    if config.baseline is not None:
+        with open(config.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, config.tolerance)
+        if regressions:
+            print("Regressions:", ", ".join(regressions))
+            failed = True
+    if failed:
+        sys.exit(1)
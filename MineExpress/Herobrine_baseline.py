@@ -1,14 +1,19 @@
-try:
-    from malmo import MalmoPython
-except:
-    import MalmoPython
-
 import os
+
+if os.environ.get("MALMO_OFFLINE"):
+    import OfflineMalmo as MalmoPython
+else:
+    try:
+        from malmo import MalmoPython
+    except:
+        import MalmoPython
+
 import sys
 import time
 import json
 import random
 import numpy as np
+from MalmoUtils import cuboidXML
 from priority_dict import priorityDictionary as PQ
 
 
@@ -117,24 +122,10 @@ def GetMissionXML(size=8):
     while (map[endPoint[0], endPoint[1]] == 0):
         endPoint = np.random.randint(8, 15, 2)
     
-    mapXML = ""
-    
-    for x in range(size, -size, -1):
-        for y in range(size, -size, -1):
-            
-            if map[x + size - 1][y + size - 1] == 0:
-                mapXML += f"<DrawBlock x='{x}'  y='10' z='{y}' type='air' />"
-            
-            elif x + size - 1 == spawnPoint[0] and y + size - 1 == spawnPoint[1]:
-                mapXML += f"<DrawBlock x='{x}'  y='10' z='{y}' type='emerald_block' />"
-            elif x + size - 1 == endPoint[0] and y + size - 1 == endPoint[1]:
-                mapXML += f"<DrawBlock x='{x}'  y='10' z='{y}' type='redstone_block' />"
-            
-            elif map[x + size - 1][y + size - 1] == 1:
-                mapXML += f"<DrawBlock x='{x}'  y='10' z='{y}' type='diamond_block' />"
-            
-            elif map[x + size - 1][y + size - 1] == 2:
-                mapXML += f"<DrawBlock x='{x}'  y='10' z='{y}' type='soul_sand' />"
+    blocks = np.array(['air', 'diamond_block', 'soul_sand'], dtype=object)[map.astype(int)]
+    blocks[spawnPoint[0], spawnPoint[1]] = 'emerald_block'
+    blocks[endPoint[0], endPoint[1]] = 'redstone_block'
+    mapXML = cuboidXML(blocks, 1 - size, 10, 1 - size)
 
     return '''<?xml version="1.0" encoding="UTF-8" standalone="no" ?>
             <Mission xmlns="http://ProjectMalmo.microsoft.com" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
@@ -1,19 +1,21 @@
-try:
-    from malmo import MalmoPython
-except:
-    import MalmoPython
-    
 import os
+
+if os.environ.get("MALMO_OFFLINE"):
+    import OfflineMalmo as MalmoPython
+else:
+    try:
+        from malmo import MalmoPython
+    except:
+        import MalmoPython
+    
 import sys
 import json
-import random
 import time
 import numpy as np 
-import matplotlib.pyplot as plt
-from priority_dict import priorityDictionary as PQ
-import HerobrineMalmoUtils as MalmoUtils
-
-np.random.seed(0)
+import PathPlanning
+import MalmoUtils
+from MetricsUtils import ReturnsPlotter
+from MalmoUtils import cuboidXML
 
 def create_malmo_obj():
     agent_host = MalmoPython.AgentHost()
@@ -63,24 +65,16 @@ def create_mission(ind,agent_host,start, dropoff, pickup):
 
 
 def GetMissionXML(start):
-    blockPosXML = ""
-    xs = [i for i in range(0,9)]
-    zs = [i for i in range(0,9)]
-    for x in xs:
-        for z in zs:
-            if x%2 == 0 or z%2==0:
-                blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='stone' />".format(x,z)
-            if x%2 == 0 and z%2==0:
-                 blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='emerald_block' />".format(x,z)
-    blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='soul_sand' />".format(0,1)
-    blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='soul_sand' />".format(3,4)
-    blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='soul_sand' />".format(5,4)
-    blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='grass' />".format(3,0)
-    blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='grass' />".format(3,2)
-    blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='grass' />".format(1,6)
-    blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='grass' />".format(1,8)
-    blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='grass' />".format(5,6)
-    blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='grass' />".format(5,8)
+    # Emerald nodes on the even cells joined by stone, the odd-odd cells are left as generated
+    blocks = np.full((9, 9), None, dtype=object)
+    blocks[::2, :] = 'stone'
+    blocks[:, ::2] = 'stone'
+    blocks[::2, ::2] = 'emerald_block'
+    for x, z in [(0, 1), (3, 4), (5, 4)]:
+        blocks[x, z] = 'soul_sand'
+    for x, z in [(3, 0), (3, 2), (1, 6), (1, 8), (5, 6), (5, 8)]:
+        blocks[x, z] = 'grass'
+    blockPosXML = cuboidXML(blocks, 0, 1, 0)
         
     return '''<?xml version="1.0" encoding="UTF-8" standalone="no" ?>
             <Mission xmlns="http://ProjectMalmo.microsoft.com" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
@@ -133,8 +127,9 @@ def GetMissionXML(start):
             </Mission>'''
 
 class MineExpressDijkstra():
-    def __init__(self):
-        self.mission = MalmoUtils.MalmoInitializer()
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.executor = MalmoUtils.PlanExecutor(agent_host)
         self.position = [i for i in range(0,9,2)]
         self.grid = []
         self.action_dict = {
@@ -156,14 +151,13 @@ class MineExpressDijkstra():
              [(0, 4), (2, 4), (4, 4), (6, 4), (8, 4)],
              [(0, 6), (2, 6), (4, 6), (6, 6), (8, 6)],
              [(0, 8), (2, 8), (4, 8), (6, 8), (8, 8)]]
+        self.plotter = ReturnsPlotter('returns.png', 'Dijkstra For Herobrine', 'num_repeats', 'Reward')
         
     def start_new_mission(self):
-        self.agent_loc = np.random.randint(0, 5, 2)
+        self.agent_loc = self.rng.integers(0, 5, 2)
         self.agent_loc = self.absolute_position[self.agent_loc[0]][self.agent_loc[1]]
-        self.package_loc = np.random.randint(0, 4)
-        self.package_dest = np.random.randint(0, 4)
-        while self.package_dest == self.package_loc:
-            self.package_dest = np.random.randint(0, 4)
+        self.package_loc = int(self.rng.integers(0, 4))
+        self.package_dest = (self.package_loc + int(self.rng.integers(1, 4))) % 4
         self.package_loc = box_locations[self.package_loc]
         self.package_dest = box_locations[self.package_dest]
         return self.agent_loc, self.package_loc, self.package_dest
@@ -176,59 +170,57 @@ class MineExpressDijkstra():
                 self.dropoff_grid = i
         
         
-    def dijkstra_shortest_path(self, start, end):
-        pre_grids = PQ()
-        grid_dist = PQ()
-        grid_dist[start] = 0
-        pre_grids[start] = -1
-        while grid_dist:
-            cur = grid_dist.smallest()
-            for g in [-81,81,-1,1]:
-                g+=cur
-                if 0>g or g>=len(self.grid):
-                    continue
-                if g in pre_grids:
-                    continue
-                if self.grid[g] == "grass":
-                    continue
-                if self.grid[g] == "soul_sand":
-                    if g not in grid_dist or grid_dist[g] > grid_dist[cur]+4:
-                        grid_dist[g] = grid_dist[cur]+4
-                        pre_grids[g] = cur
-                elif self.grid[g] == "stone":
-                    if g not in grid_dist or grid_dist[g] > grid_dist[cur]+1:
-                        grid_dist[g] = grid_dist[cur]+1
-                        pre_grids[g] = cur
-                else:
-                    if g not in grid_dist or grid_dist[g] > grid_dist[cur]:
-                        grid_dist[g] = grid_dist[cur]
-                        pre_grids[g] = cur
-            del grid_dist[cur]
-        result = []
-        cur = end
-        while pre_grids[cur] != -1:
-            result.insert(0,cur)
-            cur = pre_grids[cur]
-        result.insert(0,start)
-        return result
+    def grid_cell(self, start, g):
+        # floorAll is centred on the start block, 81 blocks wide
+        return start[0] + g % 81 - 40, start[1] + g // 81 - 40
+    
+    def cell_grid(self, start, cell):
+        return (cell[1] - start[1] + 40) * 81 + cell[0] - start[0] + 40
+    
+    def observe_grid(self, start, cell, grid):
+        # floorAll is centred on the agent, the part of it that overlaps the start's window
+        # is copied over grid, the rest of grid is kept as last seen
+        world_state = agent_host.getWorldState()
+        while world_state.is_mission_running and world_state.number_of_observations_since_last_state == 0:
+            time.sleep(0.05)
+            world_state = agent_host.getWorldState()
+        if world_state.number_of_observations_since_last_state == 0:
+            return grid
+        view = np.array(json.loads(world_state.observations[-1].text)['floorAll'], dtype=object).reshape(81, 81)
+        grid = np.array(grid, dtype=object).reshape(81, 81)
+        dx, dz = cell[0] - start[0], cell[1] - start[1]
+        grid[max(dz, 0):81 + min(dz, 0), max(dx, 0):81 + min(dx, 0)] = \
+            view[max(-dz, 0):81 + min(-dz, 0), max(-dx, 0):81 + min(-dx, 0)]
+        return grid.flatten().tolist()
+    
+    def replanner(self, start, end):
+        # The first divergence starts a D* Lite search on the floor as observed then, later
+        # ones keep it and only search the cells that changed again
+        planner = None
+        
+        def replan(cell):
+            nonlocal planner
+            print("Replanning from", cell)
+            grid = self.observe_grid(start, cell, self.grid if planner is None else planner.grid)
+            if planner is None:
+                planner = PathPlanning.DStarLite(grid, self.cell_grid(start, cell), end)
+            else:
+                planner.update_grid(grid)
+                planner.move_start(self.cell_grid(start, cell))
+            path = planner.shortest_path()
+            if not path:
+                print("No path from", cell)
+                return None
+            return self.extract_action_list_from_path(path)
+        return replan
     
     def calc_reward(self, path_list):
-        reward = 0
-        for g in path_list:
-            if self.grid[g] == "soul_sand":
-                reward-=4
-            if self.grid[g] == "stone":
-                reward-=1
+        reward = PathPlanning.calc_reward(self.grid, path_list)
         print("reward from cal:", reward)
         return reward
     
     def extract_action_list_from_path(self, path_list):
-        action_trans = {-81: 'movenorth 1', 81: 'movesouth 1', -1: 'movewest 1', 1: 'moveeast 1'}
-        alist = []
-        for i in range(len(path_list) - 1):
-            curr_block, next_block = path_list[i:(i + 2)]
-            alist.append(action_trans[next_block - curr_block])   
-        return alist
+        return PathPlanning.extract_action_list_from_path(path_list, 81)
     
     def run(self, world_state):
         while world_state.is_mission_running:
@@ -247,8 +239,14 @@ class MineExpressDijkstra():
         self.start_grid = int((len(self.grid)-1)/2)
         self.find_dest()
         print("Output (start,pickup,dropoff)", (i+1), ":", (self.start_grid, self.pickup_grid, self.dropoff_grid))
-        path1 = self.dijkstra_shortest_path(self.start_grid, self.pickup_grid)
-        path2 = self.dijkstra_shortest_path(self.pickup_grid, self.dropoff_grid)
+        # Routes are found on the node graph of the lattice and expanded back to cells
+        graph = PathPlanning.NodeGraph(self.grid)
+        path1 = graph.shortest_path(self.start_grid, self.pickup_grid)
+        path2 = graph.shortest_path(self.pickup_grid, self.dropoff_grid)
+        if not path1 or not path2:
+            # The pickup or dropoff is walled off, there is nothing to deliver
+            print("Output (no path)", (i+1), ":", (len(path1), len(path2)))
+            return None, None, 0
         reward = self.calc_reward(path1)
         reward += self.calc_reward(path2)
         print("Output (path length1)", (i+1), ":", len(path1))
@@ -258,16 +256,11 @@ class MineExpressDijkstra():
         return action_list1,action_list2, reward
 
     def save_reward(self,rewards):
-        with open('returns.txt', 'w') as f:
-            for i in range(len(rewards)):
-                f.write("{}\t{}\n".format(i+1, rewards[i])) 
+        # Only the newest reward is written, the file is truncated on the first mission
+        with open('returns.txt', 'w' if len(rewards) == 1 else 'a') as f:
+            f.write("{}\t{}\n".format(len(rewards), rewards[-1]))
                 
-        plt.clf()
-        plt.plot(range(1,len(rewards)+1), rewards)
-        plt.title('Dijkstra For Herobrine')
-        plt.ylabel('Reward')
-        plt.xlabel('num_repeats')
-        plt.savefig('returns.png')
+        self.plotter.put(len(rewards), rewards[-1])
 
         
     
@@ -290,20 +283,25 @@ for i in range(num_repeats):
     action_list1,action_list2,reward = agent.run(world_state)
     
     time.sleep(0.1)
-    '''
-    for action_index in range(len(action_list1)):
-        agent_host.sendCommand(action_list1[action_index])
-        time.sleep(0.2)
-    for action_index in range(len(action_list2)):
-        agent_host.sendCommand(action_list2[action_index])
-        time.sleep(0.2)
-    '''
+    delivered = False
+    if action_list1 is not None:
+        # Both legs are streamed, the position is only checked at the executor's checkpoints. A leg
+        # that ends in None, the mission over or no path left after a replan, is not delivered
+        pickup_cell = agent.grid_cell(start, agent.pickup_grid)
+        reached = agent.executor.execute(action_list1, start, agent.replanner(start, agent.pickup_grid))
+        if reached is not None:
+            reached = agent.executor.execute(action_list2, pickup_cell, agent.replanner(start, agent.dropoff_grid))
+        delivered = reached is not None
+    if not delivered:
+        print("Ending the mission undelivered")
+    # The use quota ends the mission
     agent_host.sendCommand("use 1")
     time.sleep(1)
     world_state = agent_host.getWorldState()
     while world_state.is_mission_running:
         world_state = agent_host.getWorldState()
-    reward += 20
+    if delivered:
+        reward += 20
     print("reward:",reward)
     cumulative_rewards+=[reward]
     agent.save_reward(cumulative_rewards)
@@ -313,4 +311,4 @@ for i in range(num_repeats):
     print()
     time.sleep(1)
 
-
+agent.plotter.close()
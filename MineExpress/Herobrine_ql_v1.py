@@ -1,15 +1,19 @@
-try:
-    from malmo import MalmoPython
-except:
-    import MalmoPython
-
 import os
+
+if os.environ.get("MALMO_OFFLINE"):
+    import OfflineMalmo as MalmoPython
+else:
+    try:
+        from malmo import MalmoPython
+    except:
+        import MalmoPython
+
 import sys
 import time
 import json
-import random
 import numpy as np
 import csv
+from MalmoUtils import cuboidXML
 
 def create_malmo_obj():
     agent_host = MalmoPython.AgentHost()
@@ -65,11 +69,10 @@ def GetMissionXML(size=2):
     original map without gap
     
     '''
-    blockPosXML = ""
-    for x in range(-size, size+1):
-        for z in range(-size, size+1):
-            blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='soul_sand' />".format(x,z)
-            blockPosXML += "<DrawBlock x='{}'  y='1' z='{}' type='grass' />".format(x,z)
+    blocks = np.full((2 * size + 1, 2 * size + 1), 'grass', dtype=object)
+    blocks[1 + size, -1 + size] = 'water'
+    blocks[size, size] = 'soul_sand'
+    blockPosXML = cuboidXML(blocks, -size, 1, -size)
     
     return '''<?xml version="1.0" encoding="UTF-8" standalone="no" ?>
             <Mission xmlns="http://ProjectMalmo.microsoft.com" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
@@ -91,8 +94,7 @@ def GetMissionXML(size=2):
                   <DrawingDecorator>''' + \
                       "<DrawCuboid x1='{}' x2='{}' y1='2' y2='4' z1='{}' z2='{}' type='air'/>".format(-size, size, -size, size) + \
                       blockPosXML + \
-                      '''<DrawBlock x='1' y='1' z='-1' type='water'/>
-                      <DrawBlock x='0' y='1' z='0' type='soul_sand'/>
+                      '''
                   </DrawingDecorator>
                   <ServerQuitWhenAnyAgentFinishes/>
                   <ServerQuitFromTimeUp timeLimitMs="1000000"/>
@@ -144,7 +146,7 @@ def GetMissionXML(size=2):
  
     
 class MineExpressBaseline():
-    def __init__(self, itemPosId=0, destPosId=1, legalPos=4, training=True):  
+    def __init__(self, itemPosId=0, destPosId=1, legalPos=4, training=True, seed=None):  
         self.legalPos = legalPos
         self.itemPosId = itemPosId
         self.destPosId = destPosId
@@ -184,6 +186,7 @@ class MineExpressBaseline():
         if self.training == False:
             self.epsilon = 0
         self.nCommand = 0 # number of actions executed so far
+        self.rng = np.random.default_rng(seed)
         
     def start_new_mission(self,itemPosId):
         self.itemPosId = itemPosId
@@ -265,12 +268,12 @@ class MineExpressBaseline():
 
     
     def choose_step(self, curr_s):
-        r = random.random()
+        r = self.rng.random()
         if  r < self.epsilon:
-            a = random.randint(0, len(self.actions) - 1)
+            a = int(self.rng.integers(len(self.actions)))
         else:
             q = np.array(self.q_table[curr_s])
-            a = random.choice(np.argwhere(q == max(q)))[0]
+            a = int(self.rng.choice(np.flatnonzero(q == q.max())))
         if self.debug:
             print("***choose_step****")
             if r < self.epsilon:
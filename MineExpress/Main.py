@@ -1,22 +1,31 @@
 # Rllib docs: https://docs.ray.io/en/latest/rllib.html
 
-try:
-    from malmo import MalmoPython
-except:
-    import MalmoPython
+import os
+
+if os.environ.get("MALMO_OFFLINE"):
+    import OfflineMalmo as MalmoPython
+else:
+    try:
+        from malmo import MalmoPython
+    except:
+        import MalmoPython
 
 import sys
 import time
+import argparse
 import json
-import matplotlib.pyplot as plt
 import numpy as np
-from numpy.random import randint
 
 import gym, ray
 from gym.spaces import Discrete, Box
 from ray.rllib.agents import ppo
 
 from tqdm import tqdm
+from MetricsUtils import ReturnsPlotter
+from MalmoUtils import cuboidXML, getClientPort
+from MineExpressEnvSimulator.DiamondCollectorSimulator import (BLOCK_CODES, BLOCK_NAMES, DIAMOND_BLOCK,
+                                                               ROTATION_INDEX, YAW_ROTATION, encodeFloor,
+                                                               evaluatePolicy, generateMaps)
 
 
 class DiamondCollector(gym.Env):
@@ -46,22 +55,23 @@ class DiamondCollector(gym.Env):
         
         self.observation_space = Box(0, 1, shape=(2 * self.obs_size * self.obs_size,), dtype=np.float32)
         
-        # Malmo Parameters
+        # Malmo Parameters, rollout workers each drive their own client and skip the trainer's argv
+        self.port = getClientPort(env_config)
         self.agent_host = MalmoPython.AgentHost()
-        try:
-            self.agent_host.parse(sys.argv)
-        except RuntimeError as e:
-            print('ERROR:', e)
-            print(self.agent_host.getUsage())
-            exit(1)
+        if getattr(env_config, "worker_index", 0) == 0:
+            try:
+                self.agent_host.parse(sys.argv)
+            except RuntimeError as e:
+                print('ERROR:', e)
+                print(self.agent_host.getUsage())
+                exit(1)
         
         # DiamondCollector Parameters
+        self.rng = np.random.default_rng(env_config.get('seed'))
         self.obs = None
         self.allow_break_action = False
         self.episode_step = 0
         self.episode_return = 0
-        self.returns = []
-        self.steps = []
         
         self.pbar = tqdm(total=50000)
     
@@ -76,17 +86,9 @@ class DiamondCollector(gym.Env):
         world_state = self.init_malmo()
         
         # Reset Variables
-        self.returns.append(self.episode_return)
-        current_step = self.steps[-1] if len(self.steps) > 0 else 0
-        self.steps.append(current_step + self.episode_step)
         self.episode_return = 0
         self.episode_step = 0
         
-        # Log
-        if len(self.returns) > self.log_frequency + 1 and \
-                len(self.returns) % self.log_frequency == 0:
-            self.log_returns()
-        
         # Get Observation
         self.obs, self.allow_break_action = self.get_observation(world_state)
         
@@ -156,39 +158,11 @@ class DiamondCollector(gym.Env):
     def get_mission_xml(self):
         self.size = 8
         
-        map = np.zeros((16, 16))
-        
-        for i in range(0, 16, 3):
-            map[i] = np.ones(16)
-            map[:, i] = np.ones(16)
-            
-            for j in range(1, 14, 3):
-                map[i, j:j + 2] = list(np.random.binomial(1, 0.25, 1) + 1) * 2
-                map[j:j + 2, i] = list(np.random.binomial(1, 0.25, 1) + 1) * 2
-        
-        spawnPoint = np.random.randint(0, 7, 2)
-        while (map[spawnPoint[0], spawnPoint[1]] == 0):
-            spawnPoint = np.random.randint(0, 7, 2)
-        
-        endPoint = np.random.randint(8, 15, 2)
-        while (map[endPoint[0], endPoint[1]] == 0):
-            endPoint = np.random.randint(8, 15, 2)
+        # Shared with DiamondCollectorSimulator, the map holds block codes with the spawn and end painted in
+        maps, spawn, _ = generateMaps(self.rng, 1)
+        map, spawnPoint = maps[0], spawn[0]
         
-        mapXML = ""
-        
-        for x in range(self.size, -self.size, -1):
-            for y in range(self.size, -self.size, -1):
-                
-                if map[x + self.size - 1][y + self.size - 1] == 0:
-                    mapXML += f"<DrawBlock x='{x}'  y='10' z='{y}' type='air' />"
-                elif x + self.size - 1 == spawnPoint[0] and y + self.size - 1 == spawnPoint[1]:
-                    mapXML += f"<DrawBlock x='{x}'  y='10' z='{y}' type='emerald_block' />"
-                elif x + self.size - 1 == endPoint[0] and y + self.size - 1 == endPoint[1]:
-                    mapXML += f"<DrawBlock x='{x}'  y='10' z='{y}' type='redstone_block' />"
-                elif map[x + self.size - 1][y + self.size - 1] == 1:
-                    mapXML += f"<DrawBlock x='{x}'  y='10' z='{y}' type='diamond_block' />"
-                elif map[x + self.size - 1][y + self.size - 1] == 2:
-                    mapXML += f"<DrawBlock x='{x}'  y='10' z='{y}' type='soul_sand' />"
+        mapXML = cuboidXML(map, 1 - self.size, 10, 1 - self.size, names=BLOCK_NAMES)
         
         return f"""
 <?xml version="1.0" encoding="UTF-8" standalone="no" ?>
@@ -269,7 +243,7 @@ class DiamondCollector(gym.Env):
         
         max_retries = 3
         my_clients = MalmoPython.ClientPool()
-        my_clients.add(MalmoPython.ClientInfo('127.0.0.1', 10000))  # add Minecraft machines here as available
+        my_clients.add(MalmoPython.ClientInfo('127.0.0.1', self.port))  # add Minecraft machines here as available
         
         for retry in range(max_retries):
             try:
@@ -293,8 +267,9 @@ class DiamondCollector(gym.Env):
     
     def get_observation(self, world_state):
         """
-        Use the agent observation API to get a flattened 2 x 5 x 5 grid around the agent.
-        The agent is in the center square facing up.
+        Use the agent observation API to get the 5 x 5 floor around the agent, encoded as
+        the flattened 2 x 5 x 5 channels of encodeFloor. The agent is in the center square
+        facing up.
 
         Args
             world_state: <object> current agent world state
@@ -319,21 +294,14 @@ class DiamondCollector(gym.Env):
                 
                 # todo
                 
-                # Get observation
-                grid = observations['floorAll']
-                for i, x in enumerate(grid):
-                    obs[i] = x == 'diamond_ore' or x == 'lava'
+                # Get observation, the floor is the bottom layer of the grid, blocks the
+                # simulator does not know count as solid
+                grid = observations['floorAll'][:self.obs_size * self.obs_size]
+                obs = encodeFloor(np.array([BLOCK_CODES.get(x, DIAMOND_BLOCK) for x in grid]))
                 
-                # Rotate observation with orientation of agent
-                obs = obs.reshape((2, self.obs_size, self.obs_size))
-                yaw = observations['Yaw']
-                if yaw >= 225 and yaw < 315:
-                    obs = np.rot90(obs, k=1, axes=(1, 2))
-                elif yaw >= 315 or yaw < 45:
-                    obs = np.rot90(obs, k=2, axes=(1, 2))
-                elif yaw >= 45 and yaw < 135:
-                    obs = np.rot90(obs, k=3, axes=(1, 2))
-                obs = obs.flatten()
+                # Rotate observation with orientation of agent, Malmo's yaw in [-180, 180) is
+                # taken modulo 360 like the simulator's
+                obs = obs[ROTATION_INDEX[YAW_ROTATION[int(np.floor(observations['Yaw'])) % 360]]]
                 
                 allow_break_action = observations['LineOfSight']['type'] == 'diamond_ore'
                 
@@ -341,36 +309,56 @@ class DiamondCollector(gym.Env):
         
         return obs, allow_break_action
     
-    def log_returns(self):
-        """
-        Log the current returns as a graph and text file
 
-        Args:
-            steps (list): list of global steps after each episode
-            returns (list): list of total return of each episode
-        """
-        box = np.ones(self.log_frequency) / self.log_frequency
-        returns_smooth = np.convolve(self.returns[1:], box, mode='same')
-        plt.clf()
-        plt.plot(self.steps[1:], returns_smooth)
-        plt.title('Diamond Collector')
-        plt.ylabel('Return')
-        plt.xlabel('Steps')
-        plt.savefig('returns.png')
-        
-        with open('returns.txt', 'w') as f:
-            for step, value in zip(self.steps[1:], self.returns[1:]):
-                f.write("{}\t{}\n".format(step, value))
+def log_returns(plotter, result, first):
+    """
+    Log the mean return of a training iteration to the graph and text file
+    """
+    plotter.put(result['timesteps_total'], result['episode_reward_mean'])
+    
+    with open('returns.txt', 'w' if first else 'a') as f:
+        f.write("{}\t{}\n".format(result['timesteps_total'], result['episode_reward_mean']))
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_workers', type=int, default=0,
+                        help='rollout workers, each needs a Minecraft client on its own port')
+    parser.add_argument('--num_envs_per_worker', type=int, default=1, help='envs, and clients, per rollout worker')
+    parser.add_argument('--rollout_fragment_length', type=int, default=200)
+    parser.add_argument('--base_port', type=int, default=10000)
+    parser.add_argument('--restore', type=str, default=None, help='checkpoint to start from')
+    parser.add_argument('--evaluate', type=int, default=0,
+                        help='evaluate the policy for this many episodes on DiamondCollectorSimulator and exit')
+    config, _ = parser.parse_known_args()
+    
     ray.init()
     trainer = ppo.PPOTrainer(env=DiamondCollector, config={
-        'env_config': {},  # No environment parameters to configure
+        'env_config': {'base_port': config.base_port, 'num_envs_per_worker': config.num_envs_per_worker},
         'framework': 'torch',  # Use pyotrch instead of tensorflow
         'num_gpus': 0,  # We aren't using GPUs
-        'num_workers': 0  # We aren't using parallelism
+        'num_workers': config.num_workers,  # Clients on base_port, base_port + 1, ...
+        'num_envs_per_worker': config.num_envs_per_worker,
+        'create_env_on_driver': False,  # Only rollout workers drive clients, see getClientPort
+        'rollout_fragment_length': config.rollout_fragment_length,
+        'train_batch_size': max(config.num_workers, 1) * config.num_envs_per_worker * config.rollout_fragment_length,
     })
+    if config.restore is not None:
+        trainer.restore(config.restore)
+    
+    if config.evaluate:
+        returns = evaluatePolicy(lambda obs: np.stack([trainer.compute_action(o) for o in obs]), config.evaluate)
+        print('Mean return over {} episodes: {:.3f} +- {:.3f}'.format(len(returns), returns.mean(), returns.std()))
+        sys.exit(0)
     
-    while True:
-        print(trainer.train())
+    # Returns are logged from the trainer's results, the envs live in the workers
+    plotter = ReturnsPlotter('returns.png', 'Diamond Collector', 'Steps', 'Mean return')
+    try:
+        first = True
+        while True:
+            result = trainer.train()
+            print(result)
+            log_returns(plotter, result, first)
+            first = False
+    finally:
+        plotter.close()
@@ -1,10 +1,14 @@
-import sys, time
+import sys, time, os, json
+import numpy as np
 import xml.etree.ElementTree as et
 
-try:
-    from malmo import MalmoPython
-except:
-    import MalmoPython
+if os.environ.get("MALMO_OFFLINE"):
+    import OfflineMalmo as MalmoPython
+else:
+    try:
+        from malmo import MalmoPython
+    except:
+        import MalmoPython
 
 et.register_namespace("", 'http://ProjectMalmo.microsoft.com')
 namespace = {'d': 'http://ProjectMalmo.microsoft.com'}
@@ -16,6 +20,13 @@ class MissionHandler:
         self.missionTree = et.parse(fileName)
         self.missionTreeRoot = self.missionTree.getroot()
     
+    @classmethod
+    def fromString(cls, missionXML: str):
+        handler = cls.__new__(cls)
+        handler.missionTreeRoot = et.fromstring(missionXML.strip())
+        handler.missionTree = et.ElementTree(handler.missionTreeRoot)
+        return handler
+    
     def __str__(self):
         return et.tostring(self.missionTreeRoot, encoding='unicode', method="xml")
     
@@ -36,30 +47,295 @@ class MissionHandler:
         node = self.getNode(tag)
         node.append(et.Element(newTag, attrib))
     
+    def setModSettings(self, **settings):
+        """
+        Set ModSettings children, e.g. MsPerTick=10, creating the section after About if the
+        mission has none. Children are kept in schema order, MsPerTick first.
+        """
+        tag = f"{{{namespace['d']}}}"
+        modSettings = self.missionTreeRoot.find("d:ModSettings", namespace)
+        if modSettings is None:
+            modSettings = et.Element(tag + "ModSettings")
+            about = self.missionTreeRoot.find("d:About", namespace)
+            self.missionTreeRoot.insert(list(self.missionTreeRoot).index(about) + 1 if about is not None else 0,
+                                        modSettings)
+        for key in ("MsPerTick", "PrioritiseOffscreenRendering"):
+            if key not in settings:
+                continue
+            node = modSettings.find(f"d:{key}", namespace)
+            if node is None:
+                node = et.Element(tag + key)
+                modSettings.insert(0 if key == "MsPerTick" else len(modSettings), node)
+            value = settings.pop(key)
+            node.text = str(value).lower() if isinstance(value, bool) else str(value)
+        assert not settings, f"Unknown ModSettings {list(settings)}"
+    
     def write(self, fileName):
         self.missionTree.write(fileName, encoding='UTF-8', xml_declaration=True)
 
 
+def compileCuboids(blocks, skip=None):
+    """
+    Cover a 2D array of block ids with rectangles of a single id by greedy run-length merging:
+    scanning row by row, each run of equal ids is grown down for as long as the rows below
+    repeat it. Cells equal to skip are left out. Returns (row1, row2, col1, col2, id) tuples
+    with inclusive bounds.
+    """
+    blocks = np.asarray(blocks)
+    rows, cols = blocks.shape
+    done = np.broadcast_to(blocks == skip, blocks.shape).copy()
+    cells = blocks.tolist()
+    cuboids = []
+    for r in range(rows):
+        c = 0
+        while c < cols:
+            if done[r, c]:
+                c += 1
+                continue
+            block = cells[r][c]
+            end = c + 1
+            while end < cols and not done[r, end] and cells[r][end] == block:
+                end += 1
+            bottom = r + 1
+            while bottom < rows and not done[bottom, c:end].any() and (blocks[bottom, c:end] == block).all():
+                bottom += 1
+            done[r:bottom, c:end] = True
+            cuboids.append((r, bottom - 1, c, end - 1, block))
+            c = end
+    return cuboids
+
+
+def cuboidXML(blocks, x, y, z, names=None, skip=None):
+    """
+    DrawCuboid elements that draw blocks[i][j] at (x + i, y, z + j), merged by compileCuboids.
+    names maps the ids of blocks to block types, by default the ids are the types.
+    """
+    return "".join(
+        f"<DrawCuboid x1='{x + r1}' x2='{x + r2}' y1='{y}' y2='{y}' z1='{z + c1}' z2='{z + c2}' "
+        f"type='{block if names is None else names[block]}'/>"
+        for r1, r2, c1, c2, block in compileCuboids(blocks, skip))
+
+
+class LatencyRecorder:
+    """
+    Opt-in timers for the env hot path. Call sites take now() and pass it back to
+    record(name, start); when disabled both are near free. endEpisode() turns the
+    durations of the episode into a log-spaced histogram plus percentiles per timer and,
+    if exportPath is set, appends them as one JSON line.
+    
+    Timers used by the wrappers:
+        send: agentHost.sendCommand, sleep: pacing sleeps after a command,
+        observation_wait: polling until an observation arrives, decode: JSON parsing and
+        grid processing, init_malmo: starting a mission, reset/step: whole env calls,
+        agent: time spent outside the env between two steps
+    """
+    
+    # Histogram bin edges in microseconds, 1us to ~30s in quarter decades
+    BIN_EDGES = 10 ** np.arange(0, 7.75, 0.25)
+    
+    def __init__(self, enabled=True, exportPath=None):
+        self.enabled = enabled
+        self.exportPath = exportPath
+        self.durations = {}
+        self.episodes = []
+        self.lastStepEnd = None
+    
+    def now(self):
+        return time.perf_counter_ns() if self.enabled else 0
+    
+    def record(self, name, start):
+        if not self.enabled:
+            return
+        elapsed = time.perf_counter_ns() - start
+        durations = self.durations.get(name)
+        if durations is None:
+            durations = self.durations[name] = []
+        durations.append(elapsed)
+    
+    def stepStarted(self):
+        if self.enabled and self.lastStepEnd is not None:
+            self.record("agent", self.lastStepEnd)
+        return self.now()
+    
+    def stepEnded(self, start):
+        self.record("step", start)
+        self.lastStepEnd = self.now()
+    
+    def summary(self):
+        summary = {}
+        for name, durations in self.durations.items():
+            micros = np.asarray(durations, dtype=np.float64) / 1000
+            p50, p90, p99 = np.percentile(micros, [50, 90, 99])
+            counts, _ = np.histogram(micros, self.BIN_EDGES)
+            summary[name] = {"count": len(micros), "mean_us": micros.mean(), "p50_us": p50, "p90_us": p90,
+                             "p99_us": p99, "max_us": micros.max(), "histogram": counts.tolist()}
+        return summary
+    
+    def endEpisode(self):
+        if not self.enabled or not self.durations:
+            return None
+        summary = {"episode": len(self.episodes), "timers": self.summary()}
+        self.episodes.append(summary)
+        self.durations = {}
+        self.lastStepEnd = None
+        
+        if self.exportPath is not None:
+            with open(self.exportPath, "a") as f:
+                f.write(json.dumps(summary) + "\n")
+        return summary
+
+
+def getClientPort(env_config, basePort=10000):
+    """
+    Minecraft client for an RLlib env. The scripts copy the trainer's num_envs_per_worker
+    into env_config and set create_env_on_driver=False, so with remote rollout workers the
+    driver (worker 0) builds no env: the workers, numbered from 1, map their envs one to one
+    onto the ports from base_port up. With num_workers=0 the driver's envs take them.
+    """
+    worker_index = getattr(env_config, "worker_index", 0)
+    vector_index = getattr(env_config, "vector_index", 0)
+    envs_per_worker = env_config.get("num_envs_per_worker", 1)
+    return env_config.get("base_port", basePort) + max(worker_index - 1, 0) * envs_per_worker + vector_index
+
+
+# (dx, dz) of the DiscreteMovementCommands moves
+MOVE_OFFSETS = {"movenorth": (0, -1), "movesouth": (0, 1), "moveeast": (1, 0), "movewest": (-1, 0)}
+
+
+class PlanExecutor:
+    """
+    Runs a whole plan of discrete commands, e.g. the moves of a Dijkstra path or of a greedy
+    policy rolled out on a model, without pacing between commands. The commands are sent in
+    chunks of checkpointInterval and the agent's position is only checked after each chunk.
+    An agent that stops short of a checkpoint for stallTicks ticks, blocked by something
+    the planner did not see, has diverged: replan(cell) is asked for the commands from the
+    cell it stands in, or None when there is no path from there. Needs ObservationFromFullStats.
+    """
+    
+    def __init__(self, agentHost, latency=None, checkpointInterval=8, msPerTick=50, stallTicks=10, maxReplans=3):
+        self.agentHost = agentHost
+        self.latency = latency if latency is not None else LatencyRecorder(enabled=False)
+        self.checkpointInterval = checkpointInterval
+        self.tickSeconds = msPerTick / 1000
+        self.stallTicks = stallTicks
+        self.maxReplans = maxReplans
+    
+    @staticmethod
+    def advance(cell, commands):
+        x, z = cell
+        for command in commands:
+            verb, _, argument = command.partition(" ")
+            if verb in MOVE_OFFSETS and float(argument or 1) != 0:
+                dx, dz = MOVE_OFFSETS[verb]
+                x, z = x + dx, z + dz
+        return x, z
+    
+    def waitForCell(self, expected):
+        """
+        Poll until the agent stands in the expected (x, z) block. Returns the block it was
+        last seen in, which is not expected when it stalled or the mission ended.
+        """
+        start = self.latency.now()
+        cell, still = None, 0
+        while still < self.stallTicks:
+            world_state = self.agentHost.getWorldState()
+            if not world_state.is_mission_running:
+                break
+            if world_state.number_of_observations_since_last_state > 0:
+                observations = json.loads(world_state.observations[-1].text)
+                seen = int(np.floor(observations["XPos"])), int(np.floor(observations["ZPos"]))
+                if seen == expected:
+                    cell = seen
+                    break
+                still = still + 1 if seen == cell else 0
+                cell = seen
+            else:
+                still += 1
+            time.sleep(self.tickSeconds)
+        self.latency.record("observation_wait", start)
+        return cell
+    
+    def execute(self, commands, start, replan=None):
+        """
+        Run commands from the (x, z) block start. Returns the block the agent ended in,
+        None if the mission ended before it was seen or replan found no path.
+        """
+        cell = tuple(start)
+        pending = list(commands)
+        replans = 0
+        while pending:
+            chunk, pending = pending[:self.checkpointInterval], pending[self.checkpointInterval:]
+            expected = self.advance(cell, chunk)
+            for command in chunk:
+                start = self.latency.now()
+                self.agentHost.sendCommand(command)
+                self.latency.record("send", start)
+            
+            reached = self.waitForCell(expected)
+            if reached == expected:
+                cell = expected
+                continue
+            if reached is None:
+                return None
+            if replan is None or replans == self.maxReplans:
+                raise RuntimeError(f"Agent Diverged From The Plan At {reached}, Expected {expected}")
+            replans += 1
+            cell = reached
+            pending = replan(cell)
+            if pending is None:
+                return None
+            pending = list(pending)
+        return cell
+
+
 class MalmoInitializer:
-    def __init__(self):
+    # Minecraft's own tick length
+    DEFAULT_MS_PER_TICK = 50
+    
+    def __init__(self, latency=None, port=10000, parseArgs=True, headless=False, msPerTick=DEFAULT_MS_PER_TICK):
+        """
+        port is the Minecraft client to start missions on, parseArgs=False skips handing
+        sys.argv to the AgentHost, which worker processes must do.
+        
+        headless and msPerTick are the training profile: headless requests no video and
+        lets the client prioritise offscreen rendering, msPerTick shortens the server tick.
+        Pacing sleeps (wait) are scaled by tickScale so commands still get the same number
+        of ticks to play out.
+        """
+        self.latency = latency if latency is not None else LatencyRecorder(enabled=False)
+        self.port = port
+        self.headless = headless
+        self.msPerTick = msPerTick
+        self.tickScale = msPerTick / self.DEFAULT_MS_PER_TICK
         self.agentHost = MalmoPython.AgentHost()
-        try:
-            self.agentHost.parse(sys.argv)
-        except RuntimeError as e:
-            print('ERROR:', e)
-            print(self.agentHost.getUsage())
-            sys.exit(1)
+        if parseArgs:
+            try:
+                self.agentHost.parse(sys.argv)
+            except RuntimeError as e:
+                print('ERROR:', e)
+                print(self.agentHost.getUsage())
+                sys.exit(1)
     
     def initMalmo(self, missionXML, missionName):
+        start = self.latency.now()
+        
+        if self.headless or self.msPerTick != self.DEFAULT_MS_PER_TICK:
+            mission = MissionHandler.fromString(missionXML)
+            settings = {"PrioritiseOffscreenRendering": True} if self.headless else {}
+            if self.msPerTick != self.DEFAULT_MS_PER_TICK:
+                settings["MsPerTick"] = self.msPerTick
+            mission.setModSettings(**settings)
+            missionXML = str(mission)
         
         my_mission = MalmoPython.MissionSpec(missionXML, True)
-        my_mission.requestVideo(800, 500)
-        my_mission.setViewpoint(1)
+        if not self.headless:
+            my_mission.requestVideo(800, 500)
+            my_mission.setViewpoint(1)
         my_mission_record = MalmoPython.MissionRecordSpec()
         
         max_retries = 3
         my_clients = MalmoPython.ClientPool()
-        my_clients.add(MalmoPython.ClientInfo('127.0.0.1', 10000))  # add Minecraft machines here as available
+        my_clients.add(MalmoPython.ClientInfo('127.0.0.1', self.port))  # add Minecraft machines here as available
         
         for retry in range(max_retries):
             try:
@@ -74,11 +350,12 @@ class MalmoInitializer:
         
         world_state = self.agentHost.getWorldState()
         while not world_state.has_mission_begun:
-            time.sleep(0.1)
+            time.sleep(0.1 * self.tickScale)
             world_state = self.agentHost.getWorldState()
             for error in world_state.errors:
                 print("\nError:", error.text)
         
+        self.latency.record("init_malmo", start)
         return world_state
     
     def getWorldState(self):
@@ -87,7 +364,30 @@ class MalmoInitializer:
             print("Error:", error.text)
         return world_state
     
-    def sendCommand(self, command: str, times=1):
+    def sendCommand(self, command: str, times=1, pace=True):
         for i in range(0, times):
+            start = self.latency.now()
+            self.agentHost.sendCommand(command)
+            self.latency.record("send", start)
+            
+            if pace:
+                self.wait(0.2)
+    
+    def sendCommands(self, commands):
+        """
+        Send commands back to back and pace once after the last, for discrete commands
+        Minecraft queues and plays out in order.
+        """
+        for command in commands:
+            start = self.latency.now()
             self.agentHost.sendCommand(command)
-            time.sleep(0.2)
+            self.latency.record("send", start)
+        self.wait(0.2)
+    
+    def wait(self, seconds):
+        """
+        Sleep for what seconds would be at the default tick length.
+        """
+        start = self.latency.now()
+        time.sleep(seconds * self.tickScale)
+        self.latency.record("sleep", start)
@@ -0,0 +1,341 @@
+import os, glob, time, queue, threading
+import numpy as np
+
+EPISODE_DTYPE = np.dtype([("episode", "<i8"), ("reward", "<f8"), ("status", "<i1")])
+
+
+class EpisodeMetricsWriter:
+    """
+    Append-only columnar store for per-episode metrics.
+
+    Layout of a metrics directory:
+        chunk-00000.npz, chunk-00001.npz, ...   sealed chunks, one array per column
+        tail.bin                                raw records of the chunk being filled
+
+    Every append writes one fixed-size record to tail.bin, so a crash loses at most
+    the records still sitting in the OS buffer. When the preallocated chunk is full it
+    is sealed into a .npz (written to a temp file and renamed) and tail.bin is truncated.
+    A run that died between the two leaves tail.bin starting with records already sealed;
+    the next writer drops those. A recovered tail longer than chunk_size, e.g. from a run
+    with a larger chunk_size, is sealed into full chunks and only the remainder kept.
+    """
+
+    def __init__(self, directory, chunk_size=65536, dtype=EPISODE_DTYPE, sync_every=1):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(dtype)
+        self.sync_every = sync_every
+
+        os.makedirs(directory, exist_ok=True)
+        chunks = chunkPaths(directory)
+        self.chunk_index = chunkNumber(chunks[-1]) + 1 if chunks else 0
+        self.buffer = np.zeros(chunk_size, dtype=self.dtype)
+        self.size = 0
+
+        # Recover the records of a chunk that was being filled when the last run died
+        tail_path = os.path.join(directory, "tail.bin")
+        if os.path.exists(tail_path):
+            tail = readTail(tail_path, self.dtype)
+            records = tail[sealedPrefix(tail, chunks, self.dtype):]
+            full = len(records) - len(records) % chunk_size
+            for start in range(0, full, chunk_size):
+                self.writeChunk(records[start:start + chunk_size])
+            if len(records) - full != len(tail):
+                # Chunks first, then the tail, so a crash in between leaves records a later
+                # writer recognises as sealed
+                temp_path = tail_path + ".tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(records[full:].tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, tail_path)
+            self.size = len(records) - full
+            self.buffer[:self.size] = records[full:]
+        self.tail = open(tail_path, "r+b" if os.path.exists(tail_path) else "wb")
+        self.tail.truncate(self.size * self.dtype.itemsize)
+        self.tail.seek(0, os.SEEK_END)
+
+    def append(self, *values):
+        self.buffer[self.size] = values
+        self.tail.write(self.buffer[self.size:self.size + 1].tobytes())
+        self.size += 1
+
+        if self.size % self.sync_every == 0:
+            self.tail.flush()
+        if self.size == self.chunk_size:
+            self.seal()
+
+    def seal(self):
+        if self.size == 0:
+            return
+        self.writeChunk(self.buffer[:self.size])
+        self.size = 0
+        self.tail.seek(0)
+        self.tail.truncate()
+        self.tail.flush()
+
+    def writeChunk(self, records):
+        path = os.path.join(self.directory, f"chunk-{self.chunk_index:05d}.npz")
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, **{name: records[name] for name in self.dtype.names})
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self.chunk_index += 1
+
+    def flush(self):
+        self.tail.flush()
+        os.fsync(self.tail.fileno())
+
+    def close(self):
+        self.seal()
+        self.tail.close()
+        os.remove(self.tail.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EpisodeMetricsReader:
+    """
+    Streams the chunks written by EpisodeMetricsWriter, including the unsealed tail of a
+    run that is still going or that crashed, without loading the whole history at once.
+    """
+
+    def __init__(self, directory, dtype=EPISODE_DTYPE):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+
+    def iterChunks(self):
+        chunks = chunkPaths(self.directory)
+        for path in chunks:
+            yield readChunk(path, self.dtype)
+
+        tail_path = os.path.join(self.directory, "tail.bin")
+        if os.path.exists(tail_path):
+            tail = readTail(tail_path, self.dtype)
+            # A seal that was cut short leaves records the newest chunks already hold
+            tail = tail[sealedPrefix(tail, chunks, self.dtype):]
+            if len(tail) > 0:
+                yield tail
+
+    def load(self):
+        chunks = list(self.iterChunks())
+        if len(chunks) == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.concatenate(chunks)
+
+    def summary(self, column="reward", status_column="status"):
+        count, total, total_sq = 0, 0.0, 0.0
+        minimum, maximum = np.inf, -np.inf
+        status_counts = {}
+
+        for chunk in self.iterChunks():
+            values = chunk[column].astype(np.float64)
+            count += len(values)
+            total += float(values.sum())
+            total_sq += float(np.square(values).sum())
+            minimum = min(minimum, float(values.min()))
+            maximum = max(maximum, float(values.max()))
+
+            if status_column in self.dtype.names:
+                statuses, counts = np.unique(chunk[status_column], return_counts=True)
+                for status, n in zip(statuses.tolist(), counts.tolist()):
+                    status_counts[status] = status_counts.get(status, 0) + n
+
+        mean = total / count if count > 0 else float("nan")
+        std = float(np.sqrt(max(total_sq / count - mean ** 2, 0))) if count > 0 else float("nan")
+        return {"count": count, "mean": mean, "std": std, "min": minimum, "max": maximum,
+                "status_counts": status_counts}
+
+
+def chunkPaths(directory):
+    return sorted(glob.glob(os.path.join(directory, "chunk-*.npz")), key=chunkNumber)
+
+
+def chunkNumber(path):
+    return int(os.path.basename(path)[len("chunk-"):-len(".npz")])
+
+
+def readChunk(path, dtype):
+    with np.load(path) as data:
+        chunk = np.empty(len(data[dtype.names[0]]), dtype=dtype)
+        for name in dtype.names:
+            chunk[name] = data[name]
+    return chunk
+
+
+def sealedPrefix(tail, chunks, dtype):
+    """
+    Number of leading records of tail that the newest chunks already hold, in order: a seal
+    that was cut short before it truncated tail.bin leaves them behind.
+    """
+    sealed, length, newest = 0, 0, []
+    for path in reversed(chunks):
+        chunk = readChunk(path, dtype)
+        length += len(chunk)
+        if length > len(tail):
+            break
+        newest.insert(0, chunk)
+        if np.array_equal(np.concatenate(newest), tail[:length]):
+            sealed = length
+    return sealed
+
+
+def readTail(path, dtype):
+    raw = np.fromfile(path, dtype=np.uint8)
+    # Drop a record that was only partly written before a crash
+    usable = len(raw) - len(raw) % dtype.itemsize
+    return raw[:usable].view(dtype).copy()
+
+
+class ReturnsPlotter:
+    """
+    Renders a returns curve from a background thread.
+
+    The training loop only pushes (x, y) points onto a queue; the thread keeps a trailing
+    box-smoothed copy of the series up to date one point at a time and redraws the figure
+    at most once every min_interval seconds, so plotting never blocks an env step.
+    """
+
+    def __init__(self, fileName="returns.png", title="", xlabel="", ylabel="Return", smoothing=1,
+                 min_interval=5.0):
+        self.fileName = fileName
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.smoothing = smoothing
+        self.min_interval = min_interval
+
+        self.queue = queue.SimpleQueue()
+        self.x = np.zeros(1024)
+        self.y = np.zeros(1024)
+        self.smooth = np.zeros(1024)
+        self.size = 0
+        self.window_sum = 0.0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, x, y):
+        self.queue.put((x, y))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        # Matplotlib is only touched from this thread, and without pyplot's global state
+        from matplotlib.figure import Figure
+        figure = Figure()
+        axes = figure.add_subplot()
+        axes.set_title(self.title)
+        axes.set_xlabel(self.xlabel)
+        axes.set_ylabel(self.ylabel)
+        line, = axes.plot([], [])
+
+        last_render = 0.0
+        dirty = False
+        running = True
+        while running:
+            timeout = max(last_render + self.min_interval - time.monotonic(), 0) if dirty else None
+            try:
+                item = self.queue.get(timeout=timeout)
+                if item is None:
+                    running = False
+                else:
+                    self.add(*item)
+                    dirty = True
+                    # Drain whatever else arrived so a burst costs one render
+                    while True:
+                        item = self.queue.get_nowait()
+                        if item is None:
+                            running = False
+                            break
+                        self.add(*item)
+            except queue.Empty:
+                pass
+
+            if dirty and (not running or time.monotonic() - last_render >= self.min_interval):
+                line.set_data(self.x[:self.size], self.smooth[:self.size])
+                axes.relim()
+                axes.autoscale_view()
+                figure.savefig(self.fileName)
+                last_render = time.monotonic()
+                dirty = False
+
+    def add(self, x, y):
+        if self.size == len(self.x):
+            self.x = np.resize(self.x, 2 * self.size)
+            self.y = np.resize(self.y, 2 * self.size)
+            self.smooth = np.resize(self.smooth, 2 * self.size)
+
+        self.x[self.size] = x
+        self.y[self.size] = y
+        self.window_sum += y
+        if self.size >= self.smoothing:
+            self.window_sum -= self.y[self.size - self.smoothing]
+        self.smooth[self.size] = self.window_sum / min(self.size + 1, self.smoothing)
+        self.size += 1
+
+
+class BatchedSummaryWriter:
+    """
+    Drop-in replacement for the add_scalar/close part of SummaryWriter.
+
+    Scalars are accumulated per tag in preallocated arrays and written out every
+    flush_episodes values or flush_seconds seconds, whichever comes first. A flush emits
+    the last value under the original tag, the mean/min/max of the batch under
+    "<tag>/mean", "<tag>/min" and "<tag>/max", and a histogram of the whole batch, "<tag>/hist".
+    """
+
+    def __init__(self, log_dir, flush_episodes=1000, flush_seconds=10.0):
+        from torch.utils.tensorboard import SummaryWriter
+        self.writer = SummaryWriter(log_dir)
+        self.flush_episodes = flush_episodes
+        self.flush_seconds = flush_seconds
+
+        self.values = {}
+        self.steps = {}
+        self.sizes = {}
+        self.last_flush = time.monotonic()
+
+    def add_scalar(self, tag, value, step):
+        if tag not in self.values:
+            self.values[tag] = np.zeros(self.flush_episodes)
+            self.steps[tag] = np.zeros(self.flush_episodes, dtype=np.int64)
+            self.sizes[tag] = 0
+
+        size = self.sizes[tag]
+        self.values[tag][size] = value
+        self.steps[tag][size] = step
+        self.sizes[tag] = size + 1
+
+        if size + 1 == self.flush_episodes or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        for tag, size in self.sizes.items():
+            if size == 0:
+                continue
+            values = self.values[tag][:size]
+            step = int(self.steps[tag][size - 1])
+
+            self.writer.add_scalar(tag, values[-1], step)
+            self.writer.add_scalar(f"{tag}/mean", values.mean(), step)
+            self.writer.add_scalar(f"{tag}/min", values.min(), step)
+            self.writer.add_scalar(f"{tag}/max", values.max(), step)
+            if size > 1:
+                self.writer.add_histogram(f"{tag}/hist", values, step)
+            self.sizes[tag] = 0
+
+        self.writer.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
@@ -28,13 +28,29 @@ class MineExpress(gym.Env):
         1: (4, 0)
         2: (0, 4)
         3: (4, 3)
+    
+    Movement backends, the movement argument:
+        walk: movenorth 1 ten times, paced 0.2 s each like a player would
+        batch: the ten discrete moves sent back to back with one pacing sleep
+        teleport: tp to the destination node, then wait for an observation there
+    Rewards come from the lane blocks observed before the move, so they are the same
+    under every backend.
         
     """
     
-    def __init__(self, seed=None):
-        if seed is not None:
-            np.random.seed(seed)
-        self.mission = MalmoUtils.MalmoInitializer()
+    MOVEMENTS = ("walk", "batch", "teleport")
+    # Blocks between two neighbouring nodes
+    NODE_SPACING = 10
+    
+    def __init__(self, seed=None, latency_file=None, port=10000, parse_args=True, headless=False, ms_per_tick=50,
+                 movement="walk"):
+        assert movement in self.MOVEMENTS, f"Unknown Movement {movement}, Expected One Of {self.MOVEMENTS}"
+        self.movement = movement
+        self.rng = np.random.default_rng(seed)
+        # Step latency instrumentation is only switched on when a file to export it to is given
+        self.latency = MalmoUtils.LatencyRecorder(latency_file is not None, latency_file)
+        # headless and ms_per_tick select the faster training profile, see MalmoInitializer
+        self.mission = MalmoUtils.MalmoInitializer(self.latency, port, parse_args, headless, ms_per_tick)
         self.absolute_position = \
             [[(2.5, 2.5), (12.5, 2.5), (22.5, 2.5), (32.5, 2.5), (42.5, 2.5)],
              [(2.5, 12.5), (12.5, 12.5), (22.5, 12.5), (32.5, 12.5), (42.5, 12.5)],
@@ -51,32 +67,37 @@ class MineExpress(gym.Env):
         
         self.action_space = Discrete(self.action_num)
         self.observation_space = Discrete(self.state_num)
+        self.action_space.seed(int(self.rng.integers(2 ** 31)))
         
         # self.reset()
     
     def reset(self):
+        self.latency.endEpisode()
+        start = self.latency.now()
+        
         # Reset init State
-        self.agent_loc = np.random.randint(0, 5, 2)
-        self.package_loc = np.random.randint(0, len(self.locations))
-        self.package_dest = np.random.randint(0, len(self.locations))
-        while self.package_dest == self.package_loc:
-            self.package_dest = np.random.randint(0, len(self.locations))
+        self.agent_loc = self.rng.integers(0, 5, 2)
+        self.package_loc = int(self.rng.integers(0, len(self.locations)))
+        # Any location but the pickup one, without a rejection loop
+        self.package_dest = (self.package_loc + int(self.rng.integers(1, len(self.locations)))) % len(self.locations)
         self.state = self.getStateNumber(self.agent_loc, self.package_loc, self.package_dest)
         self.last_action = None
         
         world_state = self.mission.getWorldState()
         if world_state.is_mission_running:
-            time.sleep(0.1)
+            self.mission.wait(0.1)
             self.mission.sendCommand("quit")
-            time.sleep(0.2)
+            self.mission.wait(0.2)
         
         self.mission.initMalmo(self.getMission(), "MineExpress")
         
         # time.sleep(0.5)
         
+        self.latency.record("reset", start)
         return self.state
     
     def step(self, action: int):
+        start = self.latency.stepStarted()
         movement_list, cost_list = self.getObservation()
         
         reward = 0
@@ -119,6 +140,7 @@ class MineExpress(gym.Env):
         self.last_action = action
         self.state = self.getStateNumber(self.agent_loc, self.package_loc, self.package_dest)
         
+        self.latency.stepEnded(start)
         return self.state, reward, done, f"last action: {self.last_action}"
     
     # def actionHandler(self, action):
@@ -173,8 +195,16 @@ class MineExpress(gym.Env):
     def actionHandler(self, action):
         useChestProcess = \
             ["setPitch 90", "use 1", "use 0", "swapInventoryItems chest:0 0", "tpy 10", "tpy 2", "setPitch 60"]
-
-        if action == 0:
+        moves = ["movenorth 1", "movesouth 1", "moveeast 1", "movewest 1"]
+        
+        if action < 4 and self.movement == "batch":
+            self.mission.sendCommands([moves[action]] * self.NODE_SPACING)
+        elif action < 4 and self.movement == "teleport":
+            # agent_loc is already the destination
+            x, z = self.getAbsolutePosition()
+            self.mission.sendCommand(f"tp {x} 2 {z}", pace=False)
+            self.waitForPosition(x, z)
+        elif action == 0:
             self.mission.sendCommand("movenorth 1", 10)
         elif action == 1:
             self.mission.sendCommand("movesouth 1", 10)
@@ -186,6 +216,25 @@ class MineExpress(gym.Env):
             for cmd in useChestProcess:
                 self.mission.sendCommand(cmd)
     
+    def waitForPosition(self, x, z, timeout=5.0):
+        """
+        Poll observations until the agent stands at (x, z), so the next step observes the
+        destination and not the node it was teleported from.
+        """
+        start = self.latency.now()
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            world_state = self.mission.getWorldState()
+            if not world_state.is_mission_running:
+                break
+            if world_state.number_of_observations_since_last_state > 0:
+                observations = json.loads(world_state.observations[-1].text)
+                if abs(observations['XPos'] - x) < 0.5 and abs(observations['ZPos'] - z) < 0.5:
+                    self.latency.record("observation_wait", start)
+                    return
+            time.sleep(self.mission.msPerTick / 1000)
+        raise AssertionError(f'Agent did not reach ({x}, {z}).')
+    
     def getMission(self):
         start_pos = self.absolute_position[self.agent_loc[0]][self.agent_loc[1]]
         
@@ -197,12 +246,16 @@ class MineExpress(gym.Env):
         return str(mission)
     
     def getObservation(self):
+        start = self.latency.now()
         world_state = self.mission.getWorldState()
         while world_state.is_mission_running:
-            time.sleep(0.1)
+            time.sleep(0.1 * self.mission.tickScale)
             if len(world_state.errors) > 0:
                 raise AssertionError('Could not load grid.')
             if world_state.number_of_observations_since_last_state > 0:
+                self.latency.record("observation_wait", start)
+                start = self.latency.now()
+                
                 # First we get the json from the observation API
                 msg = world_state.observations[-1].text
                 observations = json.loads(msg)
@@ -221,6 +274,7 @@ class MineExpress(gym.Env):
                 movement = [x in {"stone", "soul_sand"} for x in obs]
                 cost = [-1 if x == "stone" else -4 for x in obs]
                 
+                self.latency.record("decode", start)
                 return movement, cost
             world_state = self.mission.getWorldState()
         raise
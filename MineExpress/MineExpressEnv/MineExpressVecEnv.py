@@ -0,0 +1,152 @@
+import os, functools
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from gym.spaces import Discrete
+
+
+def worker(remote, parent_remote, env_fn, index):
+    parent_remote.close()
+    env = env_fn()
+    remote.send((env.observation_space, env.action_space))
+
+    buffers = None
+    try:
+        while True:
+            command, data = remote.recv()
+            if command == "attach":
+                # Workers share the parent's resource tracker, the parent unlinks the segments
+                buffers = [shared_memory.SharedMemory(name=name) for name in data["names"]]
+                observations = np.ndarray(data["shape"], dtype=data["dtype"], buffer=buffers[0].buf)
+                rewards = np.ndarray(data["num_envs"], dtype=np.float64, buffer=buffers[1].buf)
+                dones = np.ndarray(data["num_envs"], dtype=np.bool_, buffer=buffers[2].buf)
+                remote.send(None)
+            elif command == "reset":
+                observations[index] = env.reset()
+                remote.send(None)
+            elif command == "step":
+                observation, reward, done, info = env.step(data)
+                if done:
+                    # Auto reset, the last observation of the episode travels in info
+                    info = {"info": info, "terminal_observation": observation}
+                    observation = env.reset()
+                observations[index] = observation
+                rewards[index] = reward
+                dones[index] = done
+                remote.send(info)
+            elif command == "close":
+                break
+    finally:
+        if buffers is not None:
+            for buffer in buffers:
+                buffer.close()
+        remote.close()
+
+
+class SubprocVecEnv:
+    """
+    Runs one env per worker process and steps them all at once.
+
+    Observations, rewards and dones are written by the workers straight into shared
+    memory arrays, only commands and info dicts go through the pipes. stepAsync/stepWait
+    let the caller run policy inference while the K environments are stepping. Envs are
+    reset automatically when an episode ends.
+    """
+
+    def __init__(self, env_fns, start_method=None):
+        self.num_envs = len(env_fns)
+        context = multiprocessing.get_context(start_method)
+        if os.name == "posix":
+            # The segments are created once the spaces are known, after the workers start. Start
+            # the tracker first so forked workers share it rather than start their own
+            resource_tracker.ensure_running()
+
+        self.remotes, work_remotes = zip(*[context.Pipe() for _ in range(self.num_envs)])
+        self.processes = []
+        for index, (work_remote, remote, env_fn) in enumerate(zip(work_remotes, self.remotes, env_fns)):
+            process = context.Process(target=worker, args=(work_remote, remote, env_fn, index), daemon=True)
+            process.start()
+            work_remote.close()
+            self.processes.append(process)
+
+        self.observation_space, self.action_space = [remote.recv() for remote in self.remotes][0]
+
+        if isinstance(self.observation_space, Discrete):
+            shape, dtype = (self.num_envs,), np.dtype(np.int64)
+        else:
+            shape, dtype = (self.num_envs,) + self.observation_space.shape, np.dtype(self.observation_space.dtype)
+        sizes = [int(np.prod(shape)) * dtype.itemsize, self.num_envs * 8, self.num_envs]
+        self.buffers = [shared_memory.SharedMemory(create=True, size=max(size, 1)) for size in sizes]
+        self.observations = np.ndarray(shape, dtype=dtype, buffer=self.buffers[0].buf)
+        self.rewards = np.ndarray(self.num_envs, dtype=np.float64, buffer=self.buffers[1].buf)
+        self.dones = np.ndarray(self.num_envs, dtype=np.bool_, buffer=self.buffers[2].buf)
+
+        attach = {"names": [buffer.name for buffer in self.buffers], "shape": shape, "dtype": dtype,
+                  "num_envs": self.num_envs}
+        for remote in self.remotes:
+            remote.send(("attach", attach))
+        for remote in self.remotes:
+            remote.recv()
+
+        self.waiting = False
+        self.closed = False
+
+    def reset(self):
+        return self.resetEnvs(range(self.num_envs))
+
+    def resetEnvs(self, envs):
+        """
+        Reset the envs at indexes envs, e.g. ones cut off at a step limit, and return their
+        new observations.
+        """
+        envs = list(envs)
+        for env in envs:
+            self.remotes[env].send(("reset", None))
+        for env in envs:
+            self.remotes[env].recv()
+        return self.observations[envs].copy()
+
+    def stepAsync(self, actions):
+        for remote, action in zip(self.remotes, actions):
+            remote.send(("step", action))
+        self.waiting = True
+
+    def stepWait(self):
+        infos = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        return self.observations.copy(), self.rewards.copy(), self.dones.copy(), infos
+
+    def step(self, actions):
+        self.stepAsync(actions)
+        return self.stepWait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        for buffer in self.buffers:
+            buffer.close()
+            buffer.unlink()
+        self.closed = True
+
+
+def makeMineExpress(seed, port, **kwargs):
+    from MineExpressEnv.MineExpress import MineExpress
+    return MineExpress(seed, port=port, parse_args=False, **kwargs)
+
+
+def makeMineExpressVecEnv(num_envs, seed=None, base_port=10000, **kwargs):
+    """
+    num_envs MineExpress envs, the i-th one bound to the Minecraft client on base_port + i,
+    with independent random streams spawned from seed. kwargs go to every MineExpress,
+    e.g. headless=True, ms_per_tick=10, movement="teleport".
+    """
+    seeds = np.random.SeedSequence(seed).spawn(num_envs)
+    return SubprocVecEnv([functools.partial(makeMineExpress, seeds[i], base_port + i, **kwargs)
+                          for i in range(num_envs)])
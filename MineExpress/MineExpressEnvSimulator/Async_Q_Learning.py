@@ -0,0 +1,180 @@
+import os, time, argparse
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from MineExpressSimulator import MineExpressSimulator
+from MetricsUtils import BatchedSummaryWriter
+from PolicyCompiler import compileScores
+from TrainingRunner import TrainingRunner, QTableAgent, getArgumentParser
+
+
+class SharedQTableAgent(QTableAgent):
+    """
+    QTableAgent over a q_table that other processes update at the same time. Without locks
+    updates are Hogwild: rows are read and written with no synchronisation, a lost update
+    only costs one step of learning. With locks, the row of state is updated under
+    locks[state % len(locks)], so updates of one row never interleave.
+    """
+
+    def __init__(self, q_table, locks, learning_rate, gamma):
+        self.q_table = q_table
+        self.locks = locks
+        self.learning_rate = learning_rate
+        self.gamma = gamma
+
+    def update(self, state, action, reward, new_state, done):
+        if not self.locks:
+            super().update(state, action, reward, new_state, done)
+            return
+        with self.locks[state % len(self.locks)]:
+            super().update(state, action, reward, new_state, done)
+
+
+class AsyncTrainingRunner(TrainingRunner):
+    """
+    One worker's TrainingRunner. Every sync_every episodes it adds its episodes to the shared
+    progress counter, publishes (episodes, total reward, running reward) in its row of stats
+    and takes the epsilon of the global episode count, so all workers follow one schedule.
+    Training stops once the workers together have run total_episodes.
+    """
+
+    def __init__(self, env, agent, config, progress, stats, index, sync_every):
+        super().__init__(env, agent, config, root=None)
+        self.progress = progress
+        self.stats = stats
+        self.index = index
+        self.sync_every = sync_every
+        self.global_episode = 0
+        self.pending = 0
+
+    def getEpsilon(self, episode):
+        return super().getEpsilon(self.global_episode + self.pending)
+
+    def sync(self, episode, running_reward):
+        self.pending += 1
+        if self.pending < self.sync_every:
+            return False
+        self.publish(episode + 1, running_reward)
+        return self.global_episode >= self.config.total_episodes
+
+    def publish(self, episodes, running_reward):
+        with self.progress.get_lock():
+            self.progress.value += self.pending
+            self.global_episode = self.progress.value
+        self.pending = 0
+        self.stats[self.index] = episodes, self.total_reward, running_reward
+
+
+def worker(index, name, shape, locks, progress, stats_name, config, sync_every):
+    # Workers share the parent's resource tracker, the parent unlinks the segments
+    buffers = [shared_memory.SharedMemory(name=name), shared_memory.SharedMemory(name=stats_name)]
+    try:
+        train(index, buffers, shape, locks, progress, config, sync_every)
+    finally:
+        for buffer in buffers:
+            buffer.close()
+
+
+def train(index, buffers, shape, locks, progress, config, sync_every):
+    # The views on the segments go out of scope on return, before the worker closes them
+    q_table = np.ndarray(shape, dtype=np.float64, buffer=buffers[0].buf)
+    stats = np.ndarray((config.workers, 3), dtype=np.float64, buffer=buffers[1].buf)
+
+    env = MineExpressSimulator(config.seed)
+    agent = SharedQTableAgent(q_table, locks, config.learning_rate, config.gamma)
+    runner = AsyncTrainingRunner(env, agent, config, progress, stats, index, sync_every)
+    episodes = runner.run(runner.sync)
+    # Episodes since the last sync still count
+    runner.publish(episodes, runner.running_reward)
+
+
+def trainAsync(config, workers, stripes=0, sync_every=10, root="runs", start_method=None):
+    """
+    Asynchronous Q-learning: workers processes each step their own MineExpressSimulator and
+    update one q_table in shared memory, Hogwild with stripes=0 or under stripes striped
+    row locks otherwise. The parent logs the mean running reward of the workers and saves
+    the table every save_model_interval episodes, then the compiled policy, like
+    TrainingRunner. Returns a copy of the trained q_table.
+    """
+    context = multiprocessing.get_context(start_method)
+    probe = MineExpressSimulator(None)
+    shape = (probe.state_num, probe.action_num)
+
+    q_buffer = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    stats_buffer = shared_memory.SharedMemory(create=True, size=workers * 3 * 8)
+    q_table = np.ndarray(shape, dtype=np.float64, buffer=q_buffer.buf)
+    stats = np.ndarray((workers, 3), dtype=np.float64, buffer=stats_buffer.buf)
+    q_table[:] = 0
+    stats[:] = 0
+
+    run_dir, writer = None, None
+    if root is not None:
+        current_time = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(time.time()))
+        run_dir = os.path.join(root, current_time)
+        os.makedirs(os.path.join(run_dir, "data"), exist_ok=True)
+        os.makedirs(os.path.join(run_dir, "model"), exist_ok=True)
+        writer = BatchedSummaryWriter(os.path.join(run_dir, "data"))
+
+    locks = [context.Lock() for _ in range(stripes)]
+    progress = context.Value("q", 0)
+    # Every worker gets its own seed for its env and exploration streams
+    seeds = np.random.SeedSequence(config.seed).spawn(workers)
+    processes = []
+    for index in range(workers):
+        worker_config = argparse.Namespace(**vars(config))
+        worker_config.seed = int(seeds[index].generate_state(1)[0])
+        worker_config.workers = workers
+        worker_config.verbose = False
+        processes.append(context.Process(target=worker, args=(index, q_buffer.name, shape, locks, progress,
+                                                              stats_buffer.name, worker_config, sync_every),
+                                         daemon=True))
+
+    start = time.time()
+    try:
+        for process in processes:
+            process.start()
+
+        saved = 0
+        while any(process.is_alive() for process in processes):
+            time.sleep(1)
+            episode = progress.value
+            running_reward = stats[:, 2][stats[:, 0] > 0]
+            if writer is not None and len(running_reward):
+                writer.add_scalar("Running Reward", running_reward.mean(), episode)
+            if run_dir is not None and episode // config.save_model_interval > saved:
+                saved = episode // config.save_model_interval
+                np.save(os.path.join(run_dir, "model", f"episode-{saved * config.save_model_interval}"), q_table)
+            if config.verbose:
+                print(f"Episode {episode}\tEpisodes/s: {episode / (time.time() - start):.1f}"
+                      f"\tAverage reward: {running_reward.mean() if len(running_reward) else 0:.2f}")
+
+        for process in processes:
+            process.join()
+        assert all(process.exitcode == 0 for process in processes), "Worker Failed"
+
+        result = q_table.copy()
+        if writer is not None:
+            writer.close()
+        if run_dir is not None:
+            compileScores(result, source="SharedQTableAgent").save(os.path.join(run_dir, "model", "policy"))
+        if config.verbose:
+            print(f"{progress.value} episodes in {time.time() - start:.1f}s")
+        return result
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        del q_table, stats
+        for buffer in (q_buffer, stats_buffer):
+            buffer.close()
+            buffer.unlink()
+
+
+if __name__ == '__main__':
+    parser = getArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--stripes", type=int, default=0, help="row lock stripes, 0 for lock-free Hogwild updates")
+    parser.add_argument("--sync_every", type=int, default=10, help="episodes between epsilon and metric syncs")
+    config = parser.parse_args()
+
+    trainAsync(config, config.workers, config.stripes, config.sync_every)
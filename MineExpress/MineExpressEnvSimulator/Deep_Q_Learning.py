@@ -1,37 +1,137 @@
-import argparse, time, pickle
+import os, argparse, warnings
 import numpy as np
-from MineExpressSimulator import MineExpressSimulator
-from torch.utils.tensorboard import SummaryWriter
-from tqdm import tqdm
 import torch
+from concurrent.futures import ProcessPoolExecutor
 from torch import nn
-import os
+from TrainingRunner import Agent, TrainingRunner, getArgumentParser
+from TorchRuntime import addRuntimeArguments, applyRuntime, initWorker, pickBatchSize
 
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
 class Net(nn.Module):
-    def __init__(self):
+    def __init__(self, dueling=False):
         super(Net, self).__init__()
-        self.net = nn.Sequential(
-            nn.Linear(1, 512),
-            nn.Linear(256, 64),
-            nn.Linear(64, 6)
-        )
+        self.dueling = dueling
+        if not dueling:
+            self.net = nn.Sequential(
+                nn.Linear(1, 256),
+                nn.Linear(256, 64),
+                nn.Linear(64, 6)
+            )
+        else:
+            # Q(s, a) = V(s) + A(s, a) - mean A(s, .), from separate value and advantage heads
+            self.net = nn.Sequential(
+                nn.Linear(1, 256),
+                nn.Linear(256, 64)
+            )
+            self.value = nn.Linear(64, 1)
+            self.advantage = nn.Linear(64, 6)
     
     def forward(self, x):
         x = self.net(x)
+        if self.dueling:
+            advantage = self.advantage(x)
+            x = self.value(x) + advantage - advantage.mean(1, keepdim=True)
         return x
 
 
-class DQN:
-    def __init__(self, memory_size, batch_size, learning_interval, learning_rate, gamma):
+def compileNet(net, mode=None):
+    """
+    net's forward through torch.compile (mode "compile") or traced to TorchScript
+    ("script"), sharing net's parameters. Where the backend does not work, e.g. torch.compile
+    without a C++ toolchain on a CPU machine, it warns and falls back to net itself.
+    """
+    if mode is None:
+        return net
+    if mode not in ("compile", "script"):
+        raise ValueError(f"Unknown compile mode {mode!r}")
+    example = torch.zeros(2, 1, device=next(net.parameters()).device)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            compiled = torch.compile(net, dynamic=True) if mode == "compile" else torch.jit.trace(net, example)
+        # Fail here rather than in the first learn()
+        compiled(example)
+        return compiled
+    except Exception as e:
+        warnings.warn(f"Could not {mode} Net, running it eagerly: {e}")
+        return net
+
+
+def makeAdam(parameters, learning_rate, fused=False):
+    """
+    Adam over parameters, with the fused kernel when fused is set and the build and device
+    have one, else the multi-tensor (foreach) one.
+    """
+    parameters = list(parameters)
+    if fused:
+        try:
+            return torch.optim.Adam(parameters, lr=learning_rate, fused=True)
+        except RuntimeError as e:
+            warnings.warn(f"Fused Adam unavailable, using foreach: {e}")
+    return torch.optim.Adam(parameters, lr=learning_rate, foreach=fused or None)
+
+
+def learnStep(dueling=False, fused=False):
+    """
+    One learn() worth of work on a fresh Net for a batch size, forward, loss, backward and
+    Adam step, for TorchRuntime.pickBatchSize.
+    """
+    net = Net(dueling).to(DEVICE)
+    optimizer = makeAdam(net.parameters(), 1e-3, fused)
+    loss_func = nn.MSELoss()
+    
+    def step(batch_size):
+        states = torch.rand(batch_size, 1, device=DEVICE)
+        actions = torch.zeros(batch_size, 1, dtype=torch.long, device=DEVICE)
+        loss = loss_func(net(states).gather(1, actions).squeeze(1), torch.rand(batch_size, device=DEVICE))
+        optimizer.zero_grad(set_to_none=True)
+        loss.backward()
+        optimizer.step()
+    return step
+
+
+def setBatchSize(config):
+    """
+    Pick config.batch_size by micro-benchmark when config.auto_batch_size is set.
+    """
+    if config.auto_batch_size:
+        config.batch_size, timings = pickBatchSize(learnStep(config.dueling, config.fused),
+                                                   config.batch_size_candidates)
+        print("Batch size", config.batch_size, "from", {size: f"{seconds * 1e6:.0f}us"
+                                                        for size, seconds in timings.items()})
+    return config
+
+
+class DQN(Agent):
+    """
+    double takes the next action from the eval net and its value from the target net,
+    dueling uses the dueling head and n_step bootstraps from n transitions ahead, see
+    nStepTargets. The replay memory is a ring of (state, action, reward, new_state, done)
+    rows in insertion order.
+    
+    tau=None copies the eval net into the target net every learning_interval learn() calls,
+    a tau in (0, 1] moves the target net that fraction of the way towards the eval net on
+    every call (Polyak averaging). Both update the parameters in place. fused asks for the
+    fused Adam kernel, falling back to the multi-tensor one, and compile_mode runs Net
+    through compileNet.
+    """
+    
+    def __init__(self, memory_size, batch_size, learning_interval, learning_rate, gamma, double=False, dueling=False,
+                 n_step=1, seed=None, tau=None, fused=False, compile_mode=None):
         self.memory_size = memory_size
         self.learning_interval = learning_interval
         self.batch_size = batch_size
         self.gamma = gamma
+        self.double = double
+        self.n_step = n_step
+        self.tau = tau
+        self.rng = np.random.default_rng(seed)
         
-        self.eval, self.target = Net(), Net()
+        self.eval, self.target = Net(dueling), Net(dueling)
+        # Both tau schedules start the target from the eval net
+        self.target.load_state_dict(self.eval.state_dict())
         
         if torch.cuda.is_available():
             self.eval.cuda()
@@ -39,128 +139,161 @@ class DQN:
         
         self.learning_counter = 0
         self.memory_counter = 0
-        self.memory = np.zeros((memory_size, 4))
-        self.optimizer = torch.optim.Adam(self.eval.parameters(), lr=learning_rate)
+        self.memory = np.zeros((memory_size, 5))
+        self.optimizer = makeAdam(self.eval.parameters(), learning_rate, fused)
         self.loss_func = nn.MSELoss()
+        
+        self.compile_mode = compile_mode
+        self.attach()
+    
+    def attach(self):
+        self.eval_params = list(self.eval.parameters())
+        self.target_params = list(self.target.parameters())
+        self.eval_forward = compileNet(self.eval, self.compile_mode)
+        self.target_forward = compileNet(self.target, self.compile_mode)
+    
+    def __getstate__(self):
+        # Compiled forwards do not pickle, checkpoints hold the plain nets
+        state = self.__dict__.copy()
+        for key in ("eval_params", "target_params", "eval_forward", "target_forward"):
+            state.pop(key, None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compile_mode = None
+        self.attach()
+    
+    def syncTarget(self):
+        with torch.no_grad():
+            if self.tau is None:
+                torch._foreach_copy_(self.target_params, self.eval_params)
+            else:
+                torch._foreach_lerp_(self.target_params, self.eval_params, self.tau)
     
     def selectAction(self, state):
         state = torch.tensor([state]).float().unsqueeze(0).to(DEVICE)
-        action = self.eval(state)
+        with torch.no_grad():
+            action = self.eval_forward(state)
         return torch.argmax(action)
     
+    def actionValues(self, states):
+        with torch.no_grad():
+            states = torch.as_tensor(states, dtype=torch.float32).unsqueeze(1).to(DEVICE)
+            return self.eval(states).cpu().numpy()
+    
     def storeStepInfo(self, step_info):
         index = self.memory_counter % self.memory_size
         self.memory[index] = np.array(step_info)
         self.memory_counter += 1
     
+    def update(self, state, action, reward, new_state, done):
+        self.storeStepInfo([state, action, reward, new_state, done])
+        if self.memory_counter > self.memory_size:
+            self.learn()
+    
+    def save(self, path):
+        torch.save(self, f"{path}.pt")
+    
+    def nStepTargets(self, indexes):
+        """
+        n-step returns of the transitions at indexes, for the whole batch at once. The chain
+        of transition i is i, i + 1, ... in insertion order, up to n_step long; it stops after
+        a done, at the newest transition, and where the next transition does not start from
+        the state the previous one reached, an episode cut off at total_steps. Returns the
+        discounted rewards, the states to bootstrap from and their discounts, 0 after a done.
+        """
+        if self.n_step == 1:
+            rows = self.memory[indexes]
+            return rows[:, 2], rows[:, 3], self.gamma * (1 - rows[:, 4])
+        
+        count = min(self.memory_counter, self.memory_size)
+        oldest = self.memory_counter % self.memory_size if self.memory_counter > self.memory_size else 0
+        steps = np.arange(self.n_step)
+        chain = self.memory[(indexes[:, None] + steps) % self.memory_size]
+        rewards, states_, dones = chain[..., 2], chain[..., 3], chain[..., 4]
+        
+        continues = np.ones(chain.shape[:2], dtype=bool)
+        continues[:, 1:] = (dones[:, :-1] == 0) & (chain[:, 1:, 0] == states_[:, :-1]) & \
+                           (((indexes - oldest) % self.memory_size)[:, None] + steps[1:] < count)
+        alive = np.logical_and.accumulate(continues, axis=1)
+        length = alive.sum(axis=1)
+        
+        rows = np.arange(len(indexes))
+        returns = (rewards * alive * self.gamma ** steps).sum(axis=1)
+        discounts = self.gamma ** length * (1 - dones[rows, length - 1])
+        return returns, states_[rows, length - 1], discounts
+    
     def learn(self):
-        if self.learning_counter % self.learning_interval == 0:
-            self.target.load_state_dict(self.eval.state_dict())
+        if self.tau is not None or self.learning_counter % self.learning_interval == 0:
+            self.syncTarget()
         self.learning_counter += 1
         
-        indexes = np.random.choice(self.memory_size, self.batch_size)
+        indexes = self.rng.integers(min(self.memory_counter, self.memory_size), size=self.batch_size)
+        returns, states_, discounts = self.nStepTargets(indexes)
         
-        states, actions, rewards, states_ = np.split(self.memory[indexes], 4, axis=1)
+        # Everything is (batch_size,) except the (batch_size, 1) state inputs of the nets
+        states = torch.from_numpy(self.memory[indexes, 0:1]).float().to(DEVICE)
+        actions = torch.from_numpy(self.memory[indexes, 1]).long().to(DEVICE)
+        returns = torch.from_numpy(returns).float().to(DEVICE)
+        states_ = torch.from_numpy(states_).float().unsqueeze(1).to(DEVICE)
+        discounts = torch.from_numpy(discounts).float().to(DEVICE)
         
-        states = torch.from_numpy(states).float().to(DEVICE)
-        actions = torch.from_numpy(actions).long().to(DEVICE)
-        rewards = torch.from_numpy(rewards).float().to(DEVICE)
-        states_ = torch.from_numpy(states_).float().to(DEVICE)
-        
-        q_eval = self.eval(states).gather(1, actions)
-        q_target = rewards + self.gamma * self.target(states_).max(1)[0]
-        loss = self.loss_func(q_target, q_eval)
-        self.optimizer.zero_grad()
+        q_eval = self.eval_forward(states).gather(1, actions.unsqueeze(1)).squeeze(1)
+        with torch.no_grad():
+            q_next = self.target_forward(states_)
+            if self.double:
+                q_next = q_next.gather(1, self.eval_forward(states_).argmax(1, keepdim=True)).squeeze(1)
+            else:
+                q_next = q_next.max(1)[0]
+            q_target = returns + discounts * q_next
+        loss = self.loss_func(q_eval, q_target)
+        self.optimizer.zero_grad(set_to_none=True)
         loss.backward()
         self.optimizer.step()
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--total_episodes", type=int, default=5000)
-    parser.add_argument("--total_steps", type=int, default=100)
+def runSeed(config, seed):
+    from MineExpressSimulator import MineExpressSimulator, VecSimulator
     
+    config = argparse.Namespace(**vars(config))
+    config.seed = seed
+    dqn = DQN(config.memory_size, config.batch_size, config.learning_interval, config.learning_rate, config.gamma,
+              config.double, config.dueling, config.n_step, config.seed, config.tau, config.fused, config.compile)
+    # Runs started together would share a timestamped directory
+    root = "runs" if config.runs == 1 else os.path.join("runs", f"seed-{seed}")
+    if config.num_envs == 1:
+        return TrainingRunner(MineExpressSimulator(config.seed), dqn, config, root).run()
+    return TrainingRunner(VecSimulator(config.num_envs, config.seed), dqn, config, root).runBatch()
+
+
+if __name__ == '__main__':
+    parser = getArgumentParser()
     parser.add_argument("--memory_size", type=int, default=500)
     parser.add_argument("--batch_size", type=int, default=32)
     parser.add_argument("--learning_interval", type=int, default=50)
+    parser.add_argument("--double", action="store_true")
+    parser.add_argument("--dueling", action="store_true")
+    parser.add_argument("--n_step", type=int, default=1)
+    parser.add_argument("--tau", type=float, default=None, help="Polyak soft update rate, hard copies when unset")
+    parser.add_argument("--fused", action="store_true")
+    parser.add_argument("--compile", type=str, choices=["compile", "script"], default=None)
+    parser.add_argument("--runs", type=int, default=1, help="seeds seed, seed + 1, ... trained side by side")
+    parser.add_argument("--workers", type=int, default=None, help="processes for --runs, defaults to the cores")
+    config = addRuntimeArguments(parser).parse_args()
+    if config.n_step > 1 and config.num_envs > 1:
+        # runBatch interleaves the envs' transitions, nStepTargets would cut every chain at one step
+        parser.error("--n_step > 1 needs --num_envs 1")
     
-    parser.add_argument("--learning_rate", type=float, default=0.7)
-    parser.add_argument("--gamma", type=float, default=0.618)
-    parser.add_argument("--epsilon", type=float, default=1)
-    parser.add_argument("--max_epsilon", type=float, default=1)
-    parser.add_argument("--min_epsilon", type=float, default=0.3)
-    parser.add_argument("--decay_rate", type=float, default=0.001)
-    parser.add_argument("--save-model-interval", type=int, default=100)
-    parser.add_argument("--seed", type=int, default=0)
-    config = parser.parse_args()
-    
-    epsilon = config.epsilon
-    env = MineExpressSimulator(config.seed)
-    dqn = DQN(config.memory_size, config.batch_size, config.learning_interval, config.learning_rate, config.gamma)
-    
-    running_reward = 10.0
-    total_reward = 0
-    
-    current_time = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(time.time()))
-    if not os.path.exists(f"runs/{current_time}"):
-        os.makedirs(f"runs/{current_time}")
-        os.makedirs(f"runs/{current_time}/data")
-        os.makedirs(f"runs/{current_time}/model")
-    writer = SummaryWriter(f"runs/{current_time}/data")
-    
-    data = []
-    
-    for episode in tqdm(range(config.total_episodes), ascii=True, desc="Episode Progress", position=0, ncols=100):
-        
-        state = env.reset()
-        ep_reward = 0
-        status = 0
-        
-        if episode % config.save_model_interval == 0 and episode > 0:
-            torch.save(dqn, f"runs/{current_time}/model/episode-{episode}.pt")
-        
-        for step in range(config.total_steps):
-            
-            e = np.random.uniform(0, 1)
-            
-            action = dqn.selectAction(state) if e > epsilon else env.action_space.sample()
-            
-            new_state, reward, done, _ = env.step(action)
-            
-            dqn.storeStepInfo([state, action, reward, new_state])
-            
-            if dqn.memory_counter > config.memory_size:
-                dqn.learn()
-            
-            ep_reward += reward
-            total_reward += reward
-            
-            # tqdm.write(
-            #     f"Step:{step}, Reward: {reward}, State {state},Action: {_}, AL: {env.agent_loc}, PL: {env.package_loc}, DL:{env.package_dest}")
-            
-            state = new_state
-            
-            if reward == 0:
-                status = 1
-            
-            if done:
-                status = 2
-                tqdm.write("Mission Success!")
-                break
-        
-        epsilon = config.min_epsilon + (config.max_epsilon - config.min_epsilon) * np.exp(-config.decay_rate * episode)
-        
-        running_reward = 0.05 * ep_reward + (1 - 0.05) * running_reward
-        writer.add_scalar("Running Reward", running_reward, episode)
-        writer.add_scalar("Episode Reward", ep_reward, episode)
-        
-        # tqdm.write(
-        #     f"Episode {episode}\tLast reward: {ep_reward:.2f}\tAverage reward: {running_reward:.2f}"
-        # )
-        
-        data.append([episode, ep_reward, status])
-    
-    writer.close()
-    
-    with open(f"runs/{current_time}/data/data.plk", "wb") as f:
-        pickle.dump(data, f)
+    applyRuntime(config)
+    setBatchSize(config)
+    if config.runs == 1:
+        runSeed(config, config.seed)
+    else:
+        # One pinned, single threaded process per core keeps runs from competing for cores
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        workers = config.workers or cores
+        with ProcessPoolExecutor(max_workers=workers, initializer=initWorker,
+                                 initargs=(config.intra_op_threads, config.inter_op_threads,
+                                           config.cores_per_worker)) as pool:
+            list(pool.map(runSeed, [config] * config.runs, range(config.seed, config.seed + config.runs)))
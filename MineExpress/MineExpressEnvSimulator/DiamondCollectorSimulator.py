@@ -0,0 +1,176 @@
+import numpy as np
+from gym.spaces import Box
+
+# Block codes of the DiamondCollector floor at y = 10
+AIR, DIAMOND_BLOCK, SOUL_SAND, EMERALD_BLOCK, REDSTONE_BLOCK, DIAMOND_ORE, LAVA = range(7)
+BLOCK_NAMES = ['air', 'diamond_block', 'soul_sand', 'emerald_block', 'redstone_block', 'diamond_ore', 'lava']
+BLOCK_CODES = {name: code for code, name in enumerate(BLOCK_NAMES)}
+# The observation has two channels over the 5 x 5 floor: cells the agent would fall through
+# into the lava, and the soul_sand that slows it down
+FALL_BLOCKS = np.isin(BLOCK_NAMES, ('air', 'lava'))
+SLOW_BLOCKS = np.isin(BLOCK_NAMES, ('soul_sand',))
+
+MAP_SIZE = 16
+NODES = np.arange(0, MAP_SIZE, 3)
+LANES = np.arange(1, MAP_SIZE - 2, 3)
+
+# Main.DiamondCollector draws map[i][j] at x = i - 7, z = j - 7
+MAP_ORIGIN = 7
+
+OBS_SIZE = 5
+# Observations are (2, 5, 5) channels flattened, rotated with the agent's yaw. ROTATION_INDEX[k]
+# is the flat permutation of np.rot90(obs, k, axes=(1, 2)) and YAW_ROTATION the k of each degree
+# of yaw taken modulo 360.
+ROTATION_INDEX = np.stack([np.rot90(np.arange(2 * OBS_SIZE ** 2).reshape(2, OBS_SIZE, OBS_SIZE), k, axes=(1, 2))
+                           .flatten() for k in range(4)])
+YAW_ROTATION = np.zeros(360, dtype=np.intp)
+YAW_ROTATION[225:315] = 1
+YAW_ROTATION[315:] = 2
+YAW_ROTATION[:45] = 2
+YAW_ROTATION[45:135] = 3
+
+# Floor offsets (dx, dz) behind each cell of the rotated bottom layer
+_floor = ROTATION_INDEX[:, :OBS_SIZE ** 2]
+OFFSET_X = _floor % OBS_SIZE - OBS_SIZE // 2
+OFFSET_Z = _floor // OBS_SIZE - OBS_SIZE // 2
+
+# Continuous movement: walking speed in blocks/s at move 1, degrees/s at turn 1, and the
+# time a step of the live env takes, a 0.1 s sleep and a 0.1 s observation poll
+WALK_SPEED = 4.317
+TURN_SPEED = 180
+STEP_SECONDS = 0.2
+
+
+def encodeFloor(blocks):
+    """
+    (..., 25) floor block codes to the (..., 50) observation channels, FALL_BLOCKS then
+    SLOW_BLOCKS.
+    """
+    return np.concatenate([FALL_BLOCKS[blocks], SLOW_BLOCKS[blocks]], axis=-1).astype(np.float32)
+
+
+def generateMaps(rng, n):
+    """
+    n DiamondCollector maps: diamond_block nodes every 3 blocks joined by 2 block lanes that are
+    soul_sand with probability 0.25, air elsewhere. The spawn is a random solid block of the
+    [0, 7) corner and the end one of the [8, 15) corner. Returns the (n, 16, 16) block codes
+    indexed [x + 7, z + 7] and the (n, 2) map indexes of the spawn and end blocks.
+    """
+    maps = np.zeros((n, MAP_SIZE, MAP_SIZE), dtype=np.int8)
+    maps[:, NODES, :] = DIAMOND_BLOCK
+    maps[:, :, NODES] = DIAMOND_BLOCK
+
+    soul_sand = rng.random((n, 2, len(NODES), len(LANES))) < 0.25
+    lane = (DIAMOND_BLOCK + soul_sand).astype(np.int8)
+    for offset in (0, 1):
+        maps[:, NODES[:, None], LANES + offset] = lane[:, 0]
+        maps[:, LANES + offset, NODES[:, None]] = lane[:, 1]
+
+    def pick(low, high):
+        # Uniform over the solid blocks of the corner, the random scores of air blocks are zeroed
+        scores = rng.random((n, high - low, high - low)) * (maps[:, low:high, low:high] != AIR)
+        flat = scores.reshape(n, -1).argmax(axis=1)
+        return np.stack([flat // (high - low), flat % (high - low)], axis=1) + low
+
+    spawn = pick(0, 7)
+    end = pick(8, 15)
+    rows = np.arange(n)
+    maps[rows, spawn[:, 0], spawn[:, 1]] = EMERALD_BLOCK
+    maps[rows, end[:, 0], end[:, 1]] = REDSTONE_BLOCK
+    return maps, spawn, end
+
+
+class DiamondCollectorSimulator:
+    """
+    num_envs DiamondCollector missions without Minecraft, stepped together.
+
+    Actions are the (move, turn, attack) Box of Main.DiamondCollector, applied the way the
+    continuous movement commands would over one step. The observation is encodeFloor of the
+    yaw rotated 5 x 5 floor around the agent, as in the live env. Walking off the floor drops the agent into the lava (-1, episode over) and
+    the episode also ends at the move and turn command quota. The map has no diamond_ore,
+    so attack has nothing to break. Finished envs are reset at once, their last observation
+    is in info["terminal_observation"].
+    """
+
+    def __init__(self, num_envs, seed=None, max_episode_steps=100):
+        self.num_envs = num_envs
+        self.max_episode_steps = max_episode_steps
+        self.rng = np.random.default_rng(seed)
+
+        self.action_space = Box(low=-1, high=1, shape=(3,))
+        self.observation_space = Box(0, 1, shape=(2 * OBS_SIZE * OBS_SIZE,), dtype=np.float32)
+
+        # Maps are padded with air so windows around an agent that walked off stay in bounds
+        self.pad = OBS_SIZE
+        self.maps = np.zeros((num_envs, MAP_SIZE + 2 * self.pad, MAP_SIZE + 2 * self.pad), dtype=np.int8)
+        self.x = np.zeros(num_envs)
+        self.z = np.zeros(num_envs)
+        self.yaw = np.zeros(num_envs)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        self.rows = np.arange(num_envs)
+
+    def resetEnvs(self, envs):
+        maps, spawn, _ = generateMaps(self.rng, len(envs))
+        self.maps[envs, self.pad:self.pad + MAP_SIZE, self.pad:self.pad + MAP_SIZE] = maps
+        self.x[envs] = spawn[:, 0] - MAP_ORIGIN + 0.5
+        self.z[envs] = spawn[:, 1] - MAP_ORIGIN + 0.5
+        self.yaw[envs] = 0
+        self.steps[envs] = 0
+
+    def reset(self):
+        self.resetEnvs(self.rows)
+        return self.getObservation()
+
+    def step(self, actions):
+        actions = np.clip(np.asarray(actions, dtype=np.float64).reshape(self.num_envs, 3), -1, 1)
+        self.yaw = (self.yaw + actions[:, 1] * TURN_SPEED * STEP_SECONDS) % 360
+        distance = actions[:, 0] * WALK_SPEED * STEP_SECONDS
+        radians = np.radians(self.yaw)
+        self.x -= distance * np.sin(radians)
+        self.z += distance * np.cos(radians)
+        self.steps += 1
+
+        fell = self.floor() == AIR
+        rewards = np.where(fell, -1.0, 0.0)
+        dones = fell | (self.steps >= self.max_episode_steps)
+
+        obs = self.getObservation()
+        infos = [{} for _ in range(self.num_envs)]
+        if dones.any():
+            finished = np.flatnonzero(dones)
+            for env in finished:
+                infos[env]["terminal_observation"] = obs[env].copy()
+            self.resetEnvs(finished)
+            obs[finished] = self.getObservation()[finished]
+        return obs, rewards, dones, infos
+
+    def cells(self):
+        return (np.floor(self.x).astype(np.intp) + MAP_ORIGIN + self.pad,
+                np.floor(self.z).astype(np.intp) + MAP_ORIGIN + self.pad)
+
+    def floor(self):
+        x, z = self.cells()
+        return self.maps[self.rows, x, z]
+
+    def getObservation(self):
+        x, z = self.cells()
+        rotation = YAW_ROTATION[np.floor(self.yaw).astype(np.intp) % 360]
+        blocks = self.maps[self.rows[:, None], x[:, None] + OFFSET_X[rotation], z[:, None] + OFFSET_Z[rotation]]
+        return encodeFloor(blocks)
+
+
+def evaluatePolicy(compute_actions, episodes, num_envs=64, seed=None, **kwargs):
+    """
+    Run compute_actions, a function from a (num_envs, 50) batch of observations to a
+    (num_envs, 3) batch of actions, until episodes episodes have finished. Returns their returns.
+    """
+    env = DiamondCollectorSimulator(num_envs, seed, **kwargs)
+    obs = env.reset()
+    current = np.zeros(num_envs)
+    returns = []
+    while len(returns) < episodes:
+        obs, rewards, dones, _ = env.step(compute_actions(obs))
+        current += rewards
+        returns.extend(current[dones].tolist())
+        current[dones] = 0
+    return np.array(returns[:episodes])
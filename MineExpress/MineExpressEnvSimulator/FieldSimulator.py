@@ -0,0 +1,138 @@
+import gym
+import numpy as np
+from gym.spaces import Discrete, Box
+
+# Malmo timing of the live env: a move sends its command 3 times 0.2 s apart, sleeps 0.2 s
+# and polls for observations twice (0.2 s each), about 1.2 s or 24 ticks. A blocked action
+# sends nothing, about 12 ticks. The mission times out after 100 s and pays
+# 100 - 0.05 * ticks when it ends (RewardForTimeTaken).
+TICKS_PER_MOVE = 24
+TICKS_PER_WAIT = 12
+TIME_LIMIT_TICKS = 2000
+
+# Reward for touching the lane blocks and the redstone, from PPO/mission.xml
+DIAMOND_REWARD = -1
+SOUL_SAND_REWARD = -3
+GOAL_REWARD = 100
+
+
+class MineExpressFieldSimulator(gym.Env):
+    """
+    NumPy counterpart of PPO_Agent_Main.MineExpress, for pretraining PPO before moving
+    to Minecraft.
+
+    The field is a grid of gold nodes every 3 blocks joined by 2 block lanes of diamond_block
+    or soul_sand. The agent starts on a node of the z = 0 edge and must reach the redstone
+    node on the far edge. Every action moves it 3 blocks, node to node, the way
+    sendCommand(command, 3) does in the live env. Observations are the same
+    (3, field_size ** 2) tensor: diamond lanes, soul_sand lanes, agent and goal, each
+    flattened z * field_size + x as in the floor grid observation.
+
+    Fields are generated in batches by sampleFields and handed out by reset.
+    """
+
+    def __init__(self, env_config=None):
+        env_config = env_config if env_config is not None else {}
+        self.field_size = env_config.get("field_size", 16)
+        self.soul_sand_density = env_config.get("soul_sand_density", 0.30)
+        self.batch_size = env_config.get("field_batch_size", 1024)
+        self.actions = {
+            0: 'move 1',
+            1: 'move -1',
+            2: 'strafe 1',
+            3: 'strafe -1'
+        }
+        # (dx, dz) of each action with the agent facing south
+        self.moves = {0: (0, 3), 1: (0, -3), 2: (-3, 0), 3: (3, 0)}
+
+        self.action_space = Discrete(len(self.actions))
+        self.observation_space = Box(0, 1, shape=(3, self.field_size ** 2), dtype=np.float32)
+
+        # RLlib workers share env_config, give each env its own stream when a seed is set
+        seed = env_config.get("seed")
+        if seed is not None:
+            seed = [seed, getattr(env_config, "worker_index", 0), getattr(env_config, "vector_index", 0)]
+        self.rng = np.random.default_rng(seed)
+
+        # Flat cell indexes of the two blocks of every lane, lanes[0, a, b] runs along z at
+        # x = nodes[a] from node b to b + 1 and lanes[1, a, b] along x at z = nodes[a]
+        self.nodes = np.arange(0, self.field_size, 3)
+        a, b = np.meshgrid(self.nodes, self.nodes[:-1], indexing="ij")
+        offsets = np.array([1, 2])
+        along_z = (b[..., None] + offsets) * self.field_size + a[..., None]
+        along_x = a[..., None] * self.field_size + b[..., None] + offsets
+        self.lanes = np.stack([along_z, along_x])
+
+        self.fields = []
+        self.soul_sand = None
+        self.channels = None
+        self.pos = None
+        self.end_point = None
+        self.distance = None
+        self.ticks = 0
+
+    def sampleFields(self, n):
+        """
+        Draw n fields at once. Returns the soul_sand flag of every lane (n, 2, nodes, nodes - 1),
+        the diamond and soul_sand observation channels (n, 2, field_size ** 2) and the x of
+        the spawn and end nodes.
+        """
+        soul_sand = self.rng.random((n,) + self.lanes.shape[:-1]) < self.soul_sand_density
+        channels = np.zeros((n, 2, self.field_size ** 2), dtype=np.float32)
+        channels[np.arange(n)[:, None, None, None, None], soul_sand[..., None].astype(np.intp), self.lanes] = 1
+        spawn_x = self.rng.choice(self.nodes, n)
+        end_x = self.rng.choice(self.nodes, n)
+        return soul_sand, channels, spawn_x, end_x
+
+    def reset(self):
+        if not self.fields:
+            self.fields = list(zip(*self.sampleFields(self.batch_size)))
+        self.soul_sand, self.channels, spawn_x, end_x = self.fields.pop()
+
+        self.pos = (int(spawn_x), 0)
+        self.end_point = (int(end_x), self.field_size - 1)
+        self.distance = None
+        self.ticks = 0
+        return self.getObservation()
+
+    def step(self, action):
+        dx, dz = self.moves[action]
+        x, z = self.pos
+        new_x, new_z = x + dx, z + dz
+
+        reward = 0
+        if 0 <= new_x < self.field_size and 0 <= new_z < self.field_size:
+            if dx:
+                soul_sand = self.soul_sand[1, z // 3, min(x, new_x) // 3]
+            else:
+                soul_sand = self.soul_sand[0, x // 3, min(z, new_z) // 3]
+            reward += SOUL_SAND_REWARD if soul_sand else DIAMOND_REWARD
+            self.pos = (new_x, new_z)
+            self.ticks += TICKS_PER_MOVE
+        else:
+            self.ticks += TICKS_PER_WAIT
+
+        current_dst = abs(self.pos[0] - self.end_point[0]) + abs(self.pos[1] - self.end_point[1])
+        if self.distance is not None and current_dst < self.distance:
+            reward += 0.5
+        elif self.distance is not None and current_dst > self.distance:
+            reward -= 0.5
+        self.distance = current_dst
+
+        done = False
+        if current_dst == 0:
+            reward += GOAL_REWARD
+            done = True
+        if self.ticks >= TIME_LIMIT_TICKS:
+            done = True
+        if done:
+            reward += 100 - 0.05 * self.ticks
+
+        return self.getObservation(), reward, done, dict()
+
+    def getObservation(self):
+        obs = np.zeros((3, self.field_size ** 2), dtype=np.float32)
+        obs[:2] = self.channels
+        obs[2, self.end_point[1] * self.field_size + self.end_point[0]] = 1
+        obs[2, self.pos[1] * self.field_size + self.pos[0]] = 1
+        return obs
@@ -0,0 +1,140 @@
+import os, csv, time, itertools, argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from MineExpressSimulator import MineExpressSimulator
+from TrainingRunner import TrainingRunner, QTableAgent, getArgumentParser
+
+SWEPT_PARAMETERS = ["learning_rate", "gamma", "decay_rate", "min_epsilon"]
+
+
+def gridSearch(spec):
+    """
+    spec maps a parameter name to the list of values to try, every combination is a trial.
+    """
+    names = list(spec)
+    return [dict(zip(names, values)) for values in itertools.product(*(spec[name] for name in names))]
+
+
+def randomSearch(spec, samples, seed=0):
+    """
+    spec maps a parameter name to a (low, high) range sampled uniformly, or to a list of
+    more than two values sampled from directly.
+    """
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(samples):
+        trial = {}
+        for name, values in spec.items():
+            if len(values) == 2:
+                trial[name] = float(rng.uniform(values[0], values[1]))
+            else:
+                trial[name] = values[rng.integers(len(values))]
+        trials.append(trial)
+    return trials
+
+
+def makeRunner(params, seed, base_config):
+    config = argparse.Namespace(**vars(base_config))
+    for name, value in params.items():
+        setattr(config, name, value)
+    config.seed = seed
+    config.verbose = False
+
+    env = MineExpressSimulator(seed)
+    agent = QTableAgent(env.state_num, env.action_num, config.learning_rate, config.gamma)
+    return TrainingRunner(env, agent, config, root=None)
+
+
+def trainSegment(runner, start, end):
+    """
+    Train runner on episodes start .. end - 1, return it and the seconds it took.
+    """
+    begin = time.time()
+    runner.run(lambda episode, running_reward: episode + 1 >= end, start=start)
+    return runner, time.time() - begin
+
+
+def runSweep(trials, base_config, seeds=1, workers=None, report_every=200, cut_quantile=0.25, min_peers=4,
+             early_stopping=True, grace_episodes=None):
+    """
+    Run every trial once per seed across a process pool and return one row per run,
+    ordered by trial and seed. Seeds are base_config.seed, base_config.seed + 1, ...
+
+    With early stopping the runs advance in rungs of report_every episodes, like successive
+    halving: once every run still going has finished a rung, the ones below the
+    cut_quantile of their running rewards stop, provided at least min_peers are compared.
+    Every run is judged against the same peers at the same episode, whatever order the pool
+    runs them in. No run is cut before grace_episodes, by default 1 / decay_rate of the
+    slowest decaying trial, the episodes it takes epsilon to decay once by a factor of e.
+    """
+    workers = workers or os.cpu_count()
+    total_episodes = base_config.total_episodes
+    runs = [(trial_id * seeds + offset, params, base_config.seed + offset)
+            for trial_id, params in enumerate(trials) for offset in range(seeds)]
+    runners = {run_id: makeRunner(params, seed, base_config) for run_id, params, seed in runs}
+    if grace_episodes is None:
+        grace_episodes = int(np.ceil(1 / min(runner.config.decay_rate for runner in runners.values())))
+
+    seconds = dict.fromkeys(runners, 0.0)
+    episodes = dict.fromkeys(runners, 0)
+    active = list(runners)
+    rung = report_every if early_stopping else total_episodes
+    start = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while active and start < total_episodes:
+            end = min(start + rung, total_episodes)
+            futures = {run_id: pool.submit(trainSegment, runners[run_id], start, end) for run_id in active}
+            for run_id, future in futures.items():
+                runners[run_id], elapsed = future.result()
+                seconds[run_id] += elapsed
+                episodes[run_id] = end
+            start = end
+
+            if early_stopping and grace_episodes <= end < total_episodes and len(active) >= min_peers:
+                rewards = np.array([runners[run_id].running_reward for run_id in active])
+                cut = np.quantile(rewards, cut_quantile)
+                active = [run_id for run_id, reward in zip(active, rewards) if reward >= cut]
+
+    results = []
+    for run_id, params, seed in runs:
+        runner = runners[run_id]
+        results.append(dict(run=run_id, **params, seed=seed, episodes=episodes[run_id],
+                            stopped=episodes[run_id] < total_episodes,
+                            running_reward=runner.running_reward,
+                            mean_reward=runner.total_reward / episodes[run_id],
+                            seconds=seconds[run_id]))
+    return results
+
+
+def writeTable(results, fileName):
+    with open(fileName, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+if __name__ == '__main__':
+    parser = getArgumentParser(total_episodes=2000)
+    for name in SWEPT_PARAMETERS:
+        parser.add_argument(f"--{name}s", type=float, nargs="+", default=None)
+    parser.add_argument("--search", choices=["grid", "random"], default="grid")
+    parser.add_argument("--samples", type=int, default=16)
+    parser.add_argument("--seeds", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--report_every", type=int, default=200)
+    parser.add_argument("--cut_quantile", type=float, default=0.25)
+    parser.add_argument("--grace_episodes", type=int, default=None,
+                        help="episodes before any run may be cut, 1 / decay_rate of the trials by default")
+    parser.add_argument("--no_early_stopping", action="store_true")
+    parser.add_argument("--output", type=str, default="sweep.csv")
+    config = parser.parse_args()
+
+    spec = {name: getattr(config, f"{name}s") for name in SWEPT_PARAMETERS if getattr(config, f"{name}s")}
+    trials = gridSearch(spec) if config.search == "grid" else randomSearch(spec, config.samples, config.seed)
+
+    results = runSweep(trials, config, config.seeds, config.workers, config.report_every, config.cut_quantile,
+                       early_stopping=not config.no_early_stopping, grace_episodes=config.grace_episodes)
+    writeTable(results, config.output)
+
+    for row in sorted(results, key=lambda row: row["running_reward"], reverse=True):
+        print(row)
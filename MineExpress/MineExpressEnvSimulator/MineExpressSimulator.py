@@ -1,9 +1,64 @@
+import os
 import gym
-import time, MalmoUtils
 import numpy as np
-import json
 from gym.spaces import Discrete
-import os
+from RegionLoader import BLOCK_IDS, loadLayer
+
+WORLD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "MineExpressEnv", "MineExpressWorld")
+
+# Hand drawn copy of the MineExpressWorld arena, used when the world is not available
+MAP = [
+    "           ",
+    " C-P P-P-C ",
+    " : - - - - ",
+    " P-P P-P-P ",
+    " - - - - - ",
+    " P-P:P:P-P ",
+    " - - - - - ",
+    " P P-P P-P ",
+    " - - - - - ",
+    " C P-P C-P ",
+    "           "
+]
+
+
+def arenaMap(blocks, nodes=5, spacing=10, offset=2):
+    """
+    Compile the floor layer of the arena, block ids indexed [x, z], to the simulator map.
+    Node (r, c) is the 5 x 5 pad centred on x = offset + spacing * c, z = offset + spacing * r,
+    'C' if it holds a chest. The lane to the next node is '-' for stone, ':' if it crosses
+    soul_sand and ' ' if grass or a gap cuts it. Returns the map and the chest nodes.
+    """
+    size = 2 * nodes + 1
+    arena = np.full((size, size), b" ", dtype="S1")
+    chests = []
+
+    def lane(cells):
+        cells = set(cells.tolist())
+        if BLOCK_IDS["grass"] in cells or BLOCK_IDS["air"] in cells:
+            return b" "
+        return b":" if BLOCK_IDS["soul_sand"] in cells else b"-"
+
+    for r in range(nodes):
+        for c in range(nodes):
+            x, z = offset + spacing * c, offset + spacing * r
+            if (blocks[x - 2:x + 3, z - 2:z + 3] == BLOCK_IDS["chest"]).any():
+                arena[2 * r + 1, 2 * c + 1] = b"C"
+                chests.append([r, c])
+            else:
+                arena[2 * r + 1, 2 * c + 1] = b"P"
+            if c < nodes - 1:
+                arena[2 * r + 1, 2 * c + 2] = lane(blocks[x + 3:x + spacing - 2, z])
+            if r < nodes - 1:
+                arena[2 * r + 2, 2 * c + 1] = lane(blocks[x, z + 3:z + spacing - 2])
+    return arena, chests
+
+
+def loadArena(world_dir=WORLD_DIR, **kwargs):
+    """
+    arenaMap of the y = 1 floor of the 45 x 45 arena of a saved world, cached by loadLayer.
+    """
+    return arenaMap(loadLayer(world_dir, 0, 44, 0, 44, 1, **kwargs))
 
 
 
@@ -32,26 +87,21 @@ class MineExpressSimulator(gym.Env):
 
     """
     
-    def __init__(self, seed=None):
-        Map = [
-            "           ",
-            " C-P P-P-C ",
-            " : - - - - ",
-            " P-P P-P-P ",
-            " - - - - - ",
-            " P-P:P:P-P ",
-            " - - - - - ",
-            " P P-P P-P ",
-            " - - - - - ",
-            " C P-P C-P ",
-            "           "
-        ]
-        if seed is not None:
-            np.random.seed(seed)
-        
-        self.map = np.asarray(Map, dtype='c')
+    def __init__(self, seed=None, world=WORLD_DIR):
+        # seed may be an int, None or a SeedSequence spawned by spawnSimulators
+        self.rng = np.random.default_rng(seed)
 
         self.locations = [[0, 0], [4, 0], [0, 4], [4, 3]]
+        
+        # The map comes from the saved world when there is one, so the two cannot drift apart
+        if world is not None and os.path.isdir(world):
+            self.map, chests = loadArena(world)
+            # Chests that did not move keep their index, so state numbers stay comparable
+            self.locations = [loc for loc in self.locations if loc in chests] + \
+                             [loc for loc in chests if loc not in self.locations]
+            assert len(self.locations) == 4, "MineExpress States Assume 4 Chests"
+        else:
+            self.map = np.asarray(MAP, dtype='c')
 
         self.max_x = 5
         self.max_z = 5
@@ -60,30 +110,47 @@ class MineExpressSimulator(gym.Env):
         
         self.action_space = Discrete(self.action_num)
         self.observation_space = Discrete(self.state_num)
+        self.action_space.seed(int(self.rng.integers(2 ** 31)))
+        
+        # Per node and move action: whether the lane is open and its reward
+        lanes = np.stack([self.map[0:-2:2, 1::2], self.map[2::2, 1::2], self.map[1::2, 2::2], self.map[1::2, 0:-2:2]],
+                         axis=-1)[:self.max_x, :self.max_z]
+        self.move_table = lanes != b" "
+        self.cost_table = np.where(lanes == b"-", -1, -4)
     
     def reset(self):
-        self.agent_loc = np.random.randint(0, 5, 2)
-        self.package_loc = np.random.randint(0, len(self.locations))
-        self.package_dest = np.random.randint(0, len(self.locations))
-        while self.package_dest == self.package_loc:
-            self.package_dest = np.random.randint(0, len(self.locations))
+        agent_loc, package_loc, package_dest = self.sampleStarts(1)
+        self.agent_loc = agent_loc[0]
+        self.package_loc = int(package_loc[0])
+        self.package_dest = int(package_dest[0])
         self.state = self.getStateNumber()
         return  self.state
+    
+    def sampleStarts(self, n):
+        """
+        Draw n start configurations at once. The destination is drawn from the other
+        locations directly by offsetting the pickup location, so no rejection loop is needed.
+        """
+        location_num = len(self.locations)
+        agent_loc = self.rng.integers(0, [self.max_x, self.max_z], (n, 2))
+        package_loc = self.rng.integers(0, location_num, n)
+        package_dest = (package_loc + self.rng.integers(1, location_num, n)) % location_num
+        return agent_loc, package_loc, package_dest
         
     def step(self, action: int):
-        movement_list, cost_list = self.getObservation()
+        x, y = self.agent_loc
         reward = 0
         if action < 4:
-            reward = cost_list[action]
+            reward = int(self.cost_table[x, y, action])
         done = False
         
-        if action == 0 and movement_list[0]:
+        if action == 0 and self.move_table[x, y, 0]:
             self.agent_loc[0] = max(self.agent_loc[0] - 1, 0)
-        elif action == 1 and movement_list[1]:
+        elif action == 1 and self.move_table[x, y, 1]:
             self.agent_loc[0] = min(self.agent_loc[0] + 1, self.max_x-1)
-        elif action == 2 and movement_list[2]:
+        elif action == 2 and self.move_table[x, y, 2]:
             self.agent_loc[1] = min(self.agent_loc[1] + 1, self.max_z-1)
-        elif action == 3 and movement_list[3]:
+        elif action == 3 and self.move_table[x, y, 3]:
             self.agent_loc[1] = max(self.agent_loc[1] - 1, 0)
         elif action == 4:
             if self.package_loc < 4 and self.agent_loc.tolist() == self.locations[self.package_loc]:
@@ -105,19 +172,55 @@ class MineExpressSimulator(gym.Env):
     
     def getObservation(self):
         x, y = self.agent_loc
-        x, y = 2*x+1, 2*y + 1
-        
-        obs = [self.map[x-1][y], self.map[x+1][y], self.map[x][y+1], self.map[x][y-1]]
-        # print(obs)
-        
-        movement = [x != b" " for x in obs]
-        cost = [-1 if x == b"-" else -4 for x in obs]
-        
-        return movement, cost
+        return self.move_table[x, y].tolist(), self.cost_table[x, y].tolist()
 
     def getStateNumber(self):
         return 4 * (5 * ((5 * self.agent_loc[0]) + self.agent_loc[1]) + self.package_loc) + self.package_dest
 
+def spawnSimulators(seed, n):
+    """
+    n simulators with independent random streams spawned from one seed, for running
+    several environments in one process reproducibly.
+    """
+    return [MineExpressSimulator(child) for child in np.random.SeedSequence(seed).spawn(n)]
+
+
+class VecSimulator:
+    """
+    num_envs simulators from spawnSimulators stepped together in this process, with the
+    interface of MineExpressVecEnv.SubprocVecEnv for TrainingRunner.runBatch: finished envs
+    are reset at once, their last observation is in info["terminal_observation"].
+    """
+
+    def __init__(self, num_envs, seed=None):
+        self.num_envs = num_envs
+        self.envs = spawnSimulators(seed, num_envs)
+        self.action_space = self.envs[0].action_space
+        self.observation_space = self.envs[0].observation_space
+
+    def reset(self):
+        return self.resetEnvs(range(self.num_envs))
+
+    def resetEnvs(self, envs):
+        return np.array([self.envs[env].reset() for env in envs], dtype=np.int64)
+
+    def step(self, actions):
+        observations = np.zeros(self.num_envs, dtype=np.int64)
+        rewards = np.zeros(self.num_envs)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        infos = []
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            observation, rewards[i], dones[i], info = env.step(action)
+            if dones[i]:
+                info = {"info": info, "terminal_observation": observation}
+                observation = env.reset()
+            observations[i] = observation
+            infos.append(info)
+        return observations, rewards, dones, infos
+
+    def close(self):
+        pass
+
 # if __name__ == "__main__":
 #     mission = MineExpressSimulator(0)
 #     mission.reset()
@@ -0,0 +1,364 @@
+"""
+In-process stand-in for the parts of MalmoPython the MineExpress agents use.
+
+The world is a grid model built from the mission XML (flat world layers, DrawingDecorator
+blocks and cuboids, MissionSpec.drawBlock) and commands are executed against it at memory
+speed, so the Python overhead of the env wrappers can be profiled without Minecraft.
+Set MALMO_OFFLINE=1 to make MalmoUtils, Main.py and the Herobrine scripts import this
+module in place of MalmoPython.
+
+Supported:
+    DiscreteMovementCommands: move, strafe, turn, jump, use, movenorth/south/east/west
+    ContinuousMovementCommands: move, strafe, turn, each non-zero command is one block or 90 degrees
+    AbsoluteMovementCommands: tp, tpx, tpy, tpz, setYaw, setPitch
+    ChatCommands, InventoryCommands (no-op), MissionQuitCommands
+    ObservationFromFullStats, ObservationFromGrid, ObservationFromRay (block in front of the agent)
+    RewardForTouchingBlockType, RewardForSendingMatchingChatMessage
+    AgentQuitFromReachingCommandQuota, AgentQuitFromTouchingBlockType
+"""
+
+import re, json, math
+import xml.etree.ElementTree as et
+
+namespace = {'d': 'http://ProjectMalmo.microsoft.com'}
+
+# Blocks the agent can stand in, everything else blocks movement and supports it
+PASSABLE = {"air", "water", "lava", "flowing_water", "flowing_lava", "tallgrass", "redstone_wire"}
+FLAT_WORLD_IDS = {"0": "air", "1": "stone", "2": "grass", "3": "dirt", "7": "bedrock", "8": "water", "9": "water",
+                  "10": "lava", "11": "lava", "12": "sand", "88": "soul_sand"}
+DIRECTIONS = {"movenorth": (0, -1), "movesouth": (0, 1), "moveeast": (1, 0), "movewest": (-1, 0)}
+
+
+class RewardsPolicy:
+    LATEST_REWARD_ONLY = 0
+    SUM_REWARDS = 1
+    KEEP_ALL_REWARDS = 2
+
+
+class ObservationsPolicy:
+    LATEST_OBSERVATION_ONLY = 0
+    KEEP_ALL_OBSERVATIONS = 1
+
+
+class ClientInfo:
+    def __init__(self, address="127.0.0.1", port=10000):
+        self.ip_address = address
+        self.control_port = port
+
+
+class ClientPool:
+    def __init__(self):
+        self.clients = []
+
+    def add(self, client_info):
+        self.clients.append(client_info)
+
+
+class MissionRecordSpec:
+    def __init__(self, destination=""):
+        self.destination = destination
+
+
+class MissionSpec:
+    def __init__(self, xml="", validate=True):
+        self.xml = xml.strip()
+        self.extra_blocks = []
+
+    def requestVideo(self, width, height):
+        pass
+
+    def setViewpoint(self, viewpoint):
+        pass
+
+    def timeLimitInSeconds(self, seconds):
+        pass
+
+    def forceWorldReset(self):
+        pass
+
+    def drawBlock(self, x, y, z, block_type):
+        self.extra_blocks.append((int(x), int(y), int(z), block_type))
+
+    def getAsXML(self, pretty_print=False):
+        return self.xml
+
+
+class TimestampedString:
+    def __init__(self, text):
+        self.text = text
+
+
+class TimestampedReward:
+    def __init__(self, value):
+        self.value = value
+
+    def getValue(self, dimension=0):
+        return self.value
+
+
+class WorldState:
+    def __init__(self, has_mission_begun=False, is_mission_running=False, observations=(), rewards=()):
+        self.has_mission_begun = has_mission_begun
+        self.is_mission_running = is_mission_running
+        self.observations = list(observations)
+        self.rewards = list(rewards)
+        self.video_frames = []
+        self.mission_control_messages = []
+        self.errors = []
+        self.number_of_observations_since_last_state = len(self.observations)
+        self.number_of_rewards_since_last_state = len(self.rewards)
+        self.number_of_video_frames_since_last_state = 0
+
+
+class GridWorld:
+    """
+    Block model of a mission plus the agent state, commands mutate it directly.
+    """
+
+    def __init__(self, mission_spec):
+        root = et.fromstring(mission_spec.xml)
+        self.blocks = {}
+        self.layers = []
+        self.parseWorld(root)
+        for x, y, z, block_type in mission_spec.extra_blocks:
+            self.blocks[(x, y, z)] = block_type
+        self.parseAgent(root)
+
+        self.running = True
+        self.changed = True
+        self.touched_blocks = set()
+        self.touched_types = set()
+        self.command_counts = {}
+
+    def parseWorld(self, root):
+        flat = root.find(".//d:FlatWorldGenerator", namespace)
+        if flat is not None:
+            # "<version>;<count>*<id>,<count>*<id>;<biome>;<features>"
+            layers = flat.get("generatorString", "3;7,2*3,2;1;").split(";")[1]
+            for layer in filter(None, layers.split(",")):
+                count, block = layer.split("*") if "*" in layer else ("1", layer)
+                block = block.replace("minecraft:", "")
+                self.layers += [FLAT_WORLD_IDS.get(block, block)] * int(count)
+
+        for decorator in root.findall(".//d:DrawingDecorator", namespace):
+            for node in decorator:
+                tag = node.tag.split("}")[-1]
+                if tag == "DrawBlock":
+                    self.blocks[(int(node.get("x")), int(node.get("y")), int(node.get("z")))] = node.get("type")
+                elif tag == "DrawCuboid":
+                    x1, x2 = sorted((int(node.get("x1")), int(node.get("x2"))))
+                    y1, y2 = sorted((int(node.get("y1")), int(node.get("y2"))))
+                    z1, z2 = sorted((int(node.get("z1")), int(node.get("z2"))))
+                    block_type = node.get("type")
+                    for x in range(x1, x2 + 1):
+                        for y in range(y1, y2 + 1):
+                            for z in range(z1, z2 + 1):
+                                self.blocks[(x, y, z)] = block_type
+
+    def parseAgent(self, root):
+        placement = root.find(".//d:AgentStart/d:Placement", namespace)
+        attrib = placement.attrib if placement is not None else {}
+        self.x = float(attrib.get("x", 0.5))
+        self.y = float(attrib.get("y", len(self.layers)))
+        self.z = float(attrib.get("z", 0.5))
+        self.yaw = float(attrib.get("yaw", 0)) % 360
+        self.pitch = float(attrib.get("pitch", 0))
+        self.name = (root.findtext(".//d:AgentSection/d:Name", "", namespace) or "").strip()
+
+        self.grids = []
+        for grid in root.findall(".//d:ObservationFromGrid/d:Grid", namespace):
+            low, high = grid.find("d:min", namespace), grid.find("d:max", namespace)
+            if low is None or high is None:
+                continue
+            self.grids.append((grid.get("name"), grid.get("absoluteCoords", "false") == "true",
+                               [int(low.get(axis)) for axis in "xyz"], [int(high.get(axis)) for axis in "xyz"]))
+        self.full_stats = root.find(".//d:ObservationFromFullStats", namespace) is not None
+        self.ray = root.find(".//d:ObservationFromRay", namespace) is not None
+
+        self.touch_rewards = [(block.get("type"), float(block.get("reward")), block.get("behaviour", "oncePerBlock"))
+                              for block in root.findall(".//d:RewardForTouchingBlockType/d:Block", namespace)]
+        self.chat_rewards = [(re.compile(match.get("regex")), float(match.get("reward")))
+                             for match in root.findall(".//d:RewardForSendingMatchingChatMessage/d:ChatMatch",
+                                                       namespace)]
+        self.quotas = [(set(quota.get("commands").split()), int(quota.get("quota")))
+                       for quota in root.findall(".//d:AgentQuitFromReachingCommandQuota/d:Quota", namespace)]
+        self.quit_blocks = {block.get("type")
+                            for block in root.findall(".//d:AgentQuitFromTouchingBlockType/d:Block", namespace)}
+
+    def blockAt(self, x, y, z):
+        block = self.blocks.get((x, y, z))
+        if block is not None:
+            return block
+        if 0 <= y < len(self.layers):
+            return self.layers[y]
+        return "air"
+
+    def cell(self):
+        return math.floor(self.x), math.floor(self.y), math.floor(self.z)
+
+    def moveBy(self, dx, dz, rewards):
+        x, y, z = self.cell()
+        if self.blockAt(x + dx, y, z + dz) in PASSABLE and self.blockAt(x + dx, y + 1, z + dz) in PASSABLE:
+            self.x += dx
+            self.z += dz
+        self.settle(rewards)
+
+    def settle(self, rewards):
+        x, y, z = self.cell()
+        while y > 0 and self.blockAt(x, y - 1, z) in PASSABLE:
+            y -= 1
+        self.y = float(y)
+        self.changed = True
+
+        below = self.blockAt(x, y - 1, z)
+        for block_type, reward, behaviour in self.touch_rewards:
+            if block_type != below:
+                continue
+            if behaviour == "onceOnly" and block_type in self.touched_types:
+                continue
+            if behaviour == "oncePerBlock" and (x, y - 1, z) in self.touched_blocks:
+                continue
+            rewards.append(reward)
+        self.touched_types.add(below)
+        self.touched_blocks.add((x, y - 1, z))
+
+        if below in self.quit_blocks or self.blockAt(x, y, z) in self.quit_blocks:
+            self.running = False
+
+    def forward(self):
+        radians = math.radians(self.yaw)
+        return int(round(-math.sin(radians))), int(round(math.cos(radians)))
+
+    def execute(self, command, rewards):
+        verb, _, argument = command.strip().partition(" ")
+
+        if verb == "quit":
+            self.running = False
+        elif verb in DIRECTIONS:
+            dx, dz = DIRECTIONS[verb]
+            for _ in range(max(int(float(argument or 1)), 1)):
+                self.moveBy(dx, dz, rewards)
+        elif verb in {"move", "strafe"}:
+            value = float(argument or 1)
+            if value != 0:
+                fx, fz = self.forward()
+                dx, dz = (fx, fz) if verb == "move" else (-fz, fx)
+                sign = 1 if value > 0 else -1
+                self.moveBy(sign * dx, sign * dz, rewards)
+        elif verb == "turn":
+            value = float(argument or 1)
+            if value != 0:
+                self.yaw = (self.yaw + (90 if value > 0 else -90)) % 360
+                self.changed = True
+        elif verb in {"tp", "tpx", "tpy", "tpz"}:
+            values = [float(v) for v in argument.split()]
+            if verb == "tp":
+                self.x, self.y, self.z = values
+            else:
+                setattr(self, verb[-1], values[0])
+            self.settle(rewards)
+        elif verb == "setYaw":
+            self.yaw = float(argument) % 360
+            self.changed = True
+        elif verb == "setPitch":
+            self.pitch = float(argument)
+            self.changed = True
+        elif verb == "chat":
+            for regex, reward in self.chat_rewards:
+                if regex.search(argument):
+                    rewards.append(reward)
+
+        self.command_counts[verb] = self.command_counts.get(verb, 0) + 1
+        for commands, quota in self.quotas:
+            if verb in commands and sum(self.command_counts.get(c, 0) for c in commands) >= quota:
+                self.running = False
+
+    def observation(self):
+        x, y, z = self.cell()
+        observation = {}
+        if self.full_stats:
+            observation.update(XPos=self.x, YPos=self.y, ZPos=self.z, Yaw=self.yaw, Pitch=self.pitch,
+                               Name=self.name, Life=20.0, IsAlive=True)
+        for name, absolute, low, high in self.grids:
+            ox, oy, oz = (0, 0, 0) if absolute else (x, y, z)
+            observation[name] = [self.blockAt(ox + i, oy + j, oz + k)
+                                 for j in range(low[1], high[1] + 1)
+                                 for k in range(low[2], high[2] + 1)
+                                 for i in range(low[0], high[0] + 1)]
+        if self.ray:
+            fx, fz = self.forward()
+            observation["LineOfSight"] = {"type": self.blockAt(x + fx, y - 1, z + fz), "x": x + fx, "y": y - 1,
+                                          "z": z + fz, "hitType": "block", "inRange": True}
+        return json.dumps(observation)
+
+
+class AgentHost:
+    def __init__(self):
+        self.world = None
+        self.rewards = []
+        self.observations = []
+        self.last_observation = None
+        self.rewards_policy = RewardsPolicy.SUM_REWARDS
+        self.observations_policy = ObservationsPolicy.LATEST_OBSERVATION_ONLY
+
+    def parse(self, args):
+        pass
+
+    def getUsage(self):
+        return "OfflineMalmo AgentHost"
+
+    def receivedArgument(self, name):
+        return False
+
+    def setRewardsPolicy(self, policy):
+        self.rewards_policy = policy
+
+    def setObservationsPolicy(self, policy):
+        self.observations_policy = policy
+
+    def setVideoPolicy(self, policy):
+        pass
+
+    def startMission(self, mission_spec, client_pool=None, mission_record=None, role=0, experiment_id=""):
+        self.world = GridWorld(mission_spec)
+        self.rewards = []
+        self.observations = []
+        self.world.settle([])
+        self.world.touched_types.clear()
+        self.world.touched_blocks.clear()
+
+    def sendCommand(self, command, key=None):
+        if self.world is None or not self.world.running:
+            return
+        self.world.execute(command, self.rewards)
+
+    def collect(self):
+        # Minecraft sends an observation every tick, one per poll stands in for that. The JSON is
+        # only rebuilt when a command changed the world.
+        if self.world is not None and self.world.running:
+            if self.world.changed:
+                self.last_observation = TimestampedString(self.world.observation())
+                self.world.changed = False
+            self.observations.append(self.last_observation)
+        if self.observations_policy == ObservationsPolicy.LATEST_OBSERVATION_ONLY:
+            self.observations = self.observations[-1:]
+
+        rewards = self.rewards
+        if self.rewards_policy == RewardsPolicy.SUM_REWARDS and len(rewards) > 1:
+            rewards = [sum(rewards)]
+        elif self.rewards_policy == RewardsPolicy.LATEST_REWARD_ONLY:
+            rewards = rewards[-1:]
+        return [TimestampedReward(r) for r in rewards]
+
+    def peekWorldState(self):
+        rewards = self.collect()
+        running = self.world is not None and self.world.running
+        return WorldState(self.world is not None, running, self.observations, rewards)
+
+    def getWorldState(self):
+        world_state = self.peekWorldState()
+        self.observations = []
+        self.rewards = []
+        if self.world is not None and not self.world.running:
+            self.world = None
+        return world_state
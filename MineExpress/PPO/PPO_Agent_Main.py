@@ -1,9 +1,10 @@
 import gym, ray, torch
+import argparse
 import math, time, MalmoUtils
 import numpy as np
 import json
 from tqdm import tqdm
-import matplotlib.pyplot as plt
+from MetricsUtils import ReturnsPlotter
 from scipy.spatial import distance
 from gym.spaces import Discrete, Box
 from ray.rllib.agents import ppo
@@ -24,10 +25,16 @@ class MineExpress(gym.Env):
         self.action_space = Discrete(len(self.actions))
         self.observation_space = Box(0, 1, shape=(3, self.field_size ** 2), dtype=np.float32)
         
-        self.mission = MalmoUtils.MalmoInitializer()
+        # Step latency instrumentation, on when env_config names a file to export it to
+        latency_file = env_config.get("latency_file")
+        self.latency = MalmoUtils.LatencyRecorder(latency_file is not None, latency_file)
+        # Rollout workers each drive their own Minecraft client and must not parse the trainer's argv
+        worker_index = getattr(env_config, "worker_index", 0)
+        self.mission = MalmoUtils.MalmoInitializer(self.latency, MalmoUtils.getClientPort(env_config),
+                                                   parseArgs=worker_index == 0,
+                                                   headless=env_config.get("headless", False),
+                                                   msPerTick=env_config.get("ms_per_tick", 50))
         
-
-        self.rewards = []
         self.current_reward = 0
         self.step_counter = 0
         self.mission_counter = 0
@@ -37,21 +44,24 @@ class MineExpress(gym.Env):
         self.distance = None
     
     def reset(self):
-        world_state = self.mission.initMalmo(self.getMission())
+        self.latency.endEpisode()
+        start = self.latency.now()
+        
+        world_state = self.mission.initMalmo(self.getMission(), "MineExpress")
         
         print(self.current_reward)
         
-        self.rewards.append(self.current_reward)
         self.current_reward = 0
         self.mission_counter += 1
-        
-        self.getLog()
+        self.distance = None
         
         obs, isBlock = self.getObservation(world_state)
         
+        self.latency.record("reset", start)
         return obs
     
     def step(self, action):
+        start = self.latency.stepStarted()
         
         world_state = self.mission.getWorldState()
         obs, is_block = self.getObservation(world_state)
@@ -69,7 +79,7 @@ class MineExpress(gym.Env):
         elif command  == "strafe -1"  and self.pos[0] < self.field_size-1 and is_block[self.pos[0]+1, self.pos[1]] == 1:
             self.mission.sendCommand(command, 3)
 
-        time.sleep(0.2)
+        self.mission.wait(0.2)
         
         self.step_counter += 1
         
@@ -96,6 +106,7 @@ class MineExpress(gym.Env):
         
         print(reward,self.current_reward, current_dst)
         
+        self.latency.stepEnded(start)
         return obs, reward, done, dict()
         
     
@@ -150,13 +161,17 @@ class MineExpress(gym.Env):
         obs = np.zeros((3, self.field_size ** 2))
         is_block = np.zeros(self.field_size ** 2)
         
+        start = self.latency.now()
         while world_state.is_mission_running:
-            time.sleep(0.2)
+            time.sleep(0.2 * self.mission.tickScale)
             world_state = self.mission.getWorldState()
             if len(world_state.errors) > 0:
                 raise AssertionError('Could not load grid.')
             
             if world_state.number_of_observations_since_last_state > 0:
+                self.latency.record("observation_wait", start)
+                start = self.latency.now()
+                
                 # First we get the json from the observation API
                 msg = world_state.observations[-1].text
                 observations = json.loads(msg)
@@ -177,35 +192,69 @@ class MineExpress(gym.Env):
                     
                     is_block[i] = x in {"diamond_block", "soul_sand", "redstone_block", "emerald_block"}
                 
+                # The floor grid is flattened z * field_size + x
                 obs = obs.reshape((3, 16, 16))
-                is_block = is_block.reshape(16, 16)
-                obs[2, self.end_point[0], self.end_point[1]] = 1
-                obs[2, x_pos, z_pos] = 1
+                obs[2, self.end_point[1], self.end_point[0]] = 1
+                obs[2, z_pos, x_pos] = 1
                 
                 obs = obs.reshape((3, self.field_size ** 2))
                 # print(obs, is_block)
+                self.latency.record("decode", start)
                 break
-        is_block = is_block.reshape(self.field_size, self.field_size)
+        # Indexed [x, z] like self.pos
+        is_block = is_block.reshape(self.field_size, self.field_size).T
         
         return obs, is_block
     
-    def getLog(self):
-        plt.ion()
-        plt.clf()
-        plt.plot(range(0, len(self.rewards)), self.rewards)
-        plt.show()
-        plt.ion()
-        
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_workers", type=int, default=0,
+                        help="rollout workers, each needs a Minecraft client on its own port")
+    parser.add_argument("--num_envs_per_worker", type=int, default=1, help="envs, and clients, per rollout worker")
+    parser.add_argument("--rollout_fragment_length", type=int, default=200)
+    parser.add_argument("--base_port", type=int, default=10000)
+    parser.add_argument("--latency_file", type=str, default=None)
+    parser.add_argument("--headless", action="store_true", help="no video, offscreen rendering prioritised")
+    parser.add_argument("--ms_per_tick", type=int, default=50, help="Minecraft tick length, pacing scales with it")
+    parser.add_argument("--simulator", action="store_true",
+                        help="pretrain on MineExpressFieldSimulator instead of Minecraft")
+    parser.add_argument("--restore", type=str, default=None, help="checkpoint to continue training from")
+    parser.add_argument("--checkpoint_interval", type=int, default=10)
+    config, _ = parser.parse_known_args()
+    
+    if config.simulator:
+        from MineExpressEnvSimulator.FieldSimulator import MineExpressFieldSimulator
+        env = MineExpressFieldSimulator
+    else:
+        env = MineExpress
+    
     ray.init()
-    trainer = ppo.PPOTrainer(env=MineExpress, config={
-        'env_config': {},  # No environment parameters to configure
+    trainer = ppo.PPOTrainer(env=env, config={
+        'env_config': {'base_port': config.base_port, 'num_envs_per_worker': config.num_envs_per_worker,
+                       'latency_file': config.latency_file, 'headless': config.headless,
+                       'ms_per_tick': config.ms_per_tick},
         'framework': 'torch',  # Use pyotrch instead of tensorflow
         'num_gpus': 1,  # We aren't using GPUs
-        'num_workers': 0  # We aren't using parallelism
+        'num_workers': config.num_workers,  # Clients on base_port, base_port + 1, ...
+        'num_envs_per_worker': config.num_envs_per_worker,
+        'create_env_on_driver': False,  # Only rollout workers drive clients, see getClientPort
+        'rollout_fragment_length': config.rollout_fragment_length,
+        'train_batch_size': max(config.num_workers, 1) * config.num_envs_per_worker * config.rollout_fragment_length,
     })
-
-    while True:
-        print(trainer.train())
+    if config.restore is not None:
+        trainer.restore(config.restore)
+    
+    # Returns are plotted from the trainer's results, the envs live in the workers
+    plotter = ReturnsPlotter("returns.png", "MineExpress PPO", "Steps", "Mean return")
+    try:
+        while True:
+            result = trainer.train()
+            print(result)
+            plotter.put(result["timesteps_total"], result["episode_reward_mean"])
+            if result["training_iteration"] % config.checkpoint_interval == 0:
+                print("Checkpoint saved at", trainer.save())
+    finally:
+        plotter.close()
     
     
\ No newline at end of file
@@ -0,0 +1,287 @@
+import heapq
+
+# Cost of stepping onto a floor block, None means the block cannot be walked on
+BLOCK_COST = {"grass": None, "soul_sand": 4, "stone": 1}
+DEFAULT_COST = 0
+INF = float("inf")
+
+
+def dijkstra_shortest_path(grid, start, end, width=81):
+    """
+    Cheapest path between two cells of a flattened width x width floor grid, as returned
+    by a floorAll observation. Returns the list of cell indexes from start to end, [] when
+    end cannot be reached.
+    """
+    costs = [BLOCK_COST.get(block, DEFAULT_COST) for block in grid]
+    dist = {start: 0}
+    pre_grids = {start: -1}
+    queue = [(0, start)]
+    while queue:
+        d, cur = heapq.heappop(queue)
+        if cur == end:
+            break
+        if d > dist[cur]:
+            continue
+        row, col = divmod(cur, width)
+        for g, valid in ((cur - width, row > 0), (cur + width, cur + width < len(grid)),
+                         (cur - 1, col > 0), (cur + 1, col < width - 1)):
+            if not valid or costs[g] is None:
+                continue
+            new_dist = d + costs[g]
+            if g not in dist or new_dist < dist[g]:
+                dist[g] = new_dist
+                pre_grids[g] = cur
+                heapq.heappush(queue, (new_dist, g))
+
+    if end not in pre_grids:
+        return []
+    result = []
+    cur = end
+    while pre_grids[cur] != -1:
+        result.append(cur)
+        cur = pre_grids[cur]
+    result.append(start)
+    result.reverse()
+    return result
+
+
+# Blocks that mark the nodes of a lattice map, the agent's spawn, pickup and dropoff
+NODE_BLOCKS = {"emerald_block", "redstone_block", "diamond_block"}
+
+
+class NodeGraph:
+    """
+    The floor grid collapsed to its nodes: node blocks and every walkable cell that does not
+    have exactly two walkable neighbours. Each corridor between two nodes becomes one edge
+    weighted with the cost of stepping through it, so after the one pass over the grid that
+    builds the graph, queries only cost as much as the number of nodes. Paths come back
+    expanded to cells like dijkstra_shortest_path's.
+    """
+
+    def __init__(self, grid, width=81, node_blocks=NODE_BLOCKS):
+        self.grid = grid
+        self.width = width
+        self.costs = [BLOCK_COST.get(block, DEFAULT_COST) for block in grid]
+        walkable = [self.walkable_neighbours(cur) for cur in range(len(grid))]
+        self.nodes = {cur for cur, block in enumerate(grid) if self.costs[cur] is not None
+                      and (block in node_blocks or len(walkable[cur]) != 2)}
+
+        # edges[u] holds (v, weight, cells after u up to and including v), corridor[cell] is
+        # (u, cells, index of cell in cells) for the cells inside a corridor
+        self.edges = {u: [] for u in self.nodes}
+        self.corridor = {}
+        for u in self.nodes:
+            for cur in walkable[u]:
+                prev, cells = u, [cur]
+                while cur not in self.nodes:
+                    prev, cur = cur, walkable[cur][0] if walkable[cur][1] == prev else walkable[cur][1]
+                    cells.append(cur)
+                self.edges[u].append((cur, sum(self.costs[c] for c in cells), cells))
+                for i, c in enumerate(cells[:-1]):
+                    self.corridor.setdefault(c, (u, cells, i))
+
+    def walkable_neighbours(self, cur):
+        row, col = divmod(cur, self.width)
+        return [g for g, valid in ((cur - self.width, row > 0), (cur + self.width, cur + self.width < len(self.grid)),
+                                   (cur - 1, col > 0), (cur + 1, col < self.width - 1))
+                if valid and self.costs[g] is not None]
+
+    def weighted(self, cells):
+        return sum(self.costs[c] for c in cells), cells
+
+    def split_edges(self, start, end):
+        """
+        Extra edges for a start or end inside a corridor, joining it to the corridor's ends.
+        """
+        extra = {}
+        if start in self.corridor:
+            u, cells, i = self.corridor[start]
+            extra[start] = [(cells[-1],) + self.weighted(cells[i + 1:]), (u,) + self.weighted(cells[:i][::-1] + [u])]
+        if end in self.corridor:
+            u, cells, i = self.corridor[end]
+            extra.setdefault(u, []).append((end,) + self.weighted(cells[:i + 1]))
+            extra.setdefault(cells[-1], []).append((end,) + self.weighted(cells[i:-1][::-1]))
+            if start in self.corridor and self.corridor[start][1] is cells:
+                j = self.corridor[start][2]
+                extra[start].append((end,) + self.weighted(cells[j + 1:i + 1] if i > j else cells[i:j][::-1]))
+        return extra
+
+    def shortest_path(self, start, end):
+        """
+        Cheapest path from start to end as cell indexes, [] when end cannot be reached.
+        """
+        if start == end:
+            return [start]
+        extra = self.split_edges(start, end)
+        dist = {start: 0}
+        pre = {start: None}
+        queue = [(0, start)]
+        while queue:
+            d, cur = heapq.heappop(queue)
+            if cur == end:
+                break
+            if d > dist[cur]:
+                continue
+            for nxt, weight, cells in self.edges.get(cur, []) + extra.get(cur, []):
+                if nxt not in dist or d + weight < dist[nxt]:
+                    dist[nxt] = d + weight
+                    pre[nxt] = (cur, cells)
+                    heapq.heappush(queue, (d + weight, nxt))
+
+        if end not in pre:
+            return []
+        result = []
+        cur = end
+        while pre[cur] is not None:
+            cur, cells = pre[cur]
+            result = cells + result
+        return [start] + result
+
+
+class DStarLite:
+    """
+    Incremental cheapest path search (D* Lite) over the same flattened floor grid and block
+    costs as dijkstra_shortest_path. The search runs backwards from end and keeps its state,
+    so after update_cells or move_start only the cells whose distance to end changed are
+    searched again. Distances are None where end cannot be reached.
+
+    Internally a step costs its block cost times len(grid) plus one, so every step costs
+    something and among the cheapest paths the shortest one wins, the way Dijkstra's pops
+    would. Dividing by len(grid) gives the block cost back exactly.
+    """
+
+    def __init__(self, grid, start, end, width=81):
+        self.grid = list(grid)
+        self.width = width
+        self.scale = len(self.grid)
+        self.costs = [self.step_cost(block) for block in self.grid]
+        # Admissible heuristic: Manhattan distance times the cheapest step
+        self.min_cost = min([c for c in BLOCK_COST.values() if c is not None] + [DEFAULT_COST]) * self.scale + 1
+        self.start = start
+        self.end = end
+        self.km = 0
+        self.g = {}
+        self.rhs = {end: 0}
+        self.open = {}
+        self.queue = []
+        self.push(end)
+
+    def step_cost(self, block):
+        cost = BLOCK_COST.get(block, DEFAULT_COST)
+        return None if cost is None else cost * self.scale + 1
+
+    def heuristic(self, a, b):
+        (ar, ac), (br, bc) = divmod(a, self.width), divmod(b, self.width)
+        return self.min_cost * (abs(ar - br) + abs(ac - bc))
+
+    def neighbours(self, cur):
+        row, col = divmod(cur, self.width)
+        if row > 0:
+            yield cur - self.width
+        if cur + self.width < len(self.grid):
+            yield cur + self.width
+        if col > 0:
+            yield cur - 1
+        if col < self.width - 1:
+            yield cur + 1
+
+    def key(self, cur):
+        best = min(self.g.get(cur, INF), self.rhs.get(cur, INF))
+        return best + self.heuristic(self.start, cur) + self.km, best
+
+    def push(self, cur):
+        key = self.key(cur)
+        self.open[cur] = key
+        heapq.heappush(self.queue, (key, cur))
+
+    def update_vertex(self, cur):
+        if cur != self.end:
+            self.rhs[cur] = min((self.costs[n] + self.g.get(n, INF) for n in self.neighbours(cur)
+                                 if self.costs[n] is not None), default=INF)
+        self.open.pop(cur, None)
+        if self.g.get(cur, INF) != self.rhs.get(cur, INF):
+            self.push(cur)
+
+    def compute(self):
+        while self.queue:
+            key, cur = self.queue[0]
+            if self.open.get(cur) != key:
+                # Superseded or already closed entry
+                heapq.heappop(self.queue)
+                continue
+            if key > self.key(self.start) and self.rhs.get(self.start, INF) == self.g.get(self.start, INF):
+                break
+            heapq.heappop(self.queue)
+            del self.open[cur]
+            new_key = self.key(cur)
+            g, rhs = self.g.get(cur, INF), self.rhs.get(cur, INF)
+            if key < new_key:
+                self.push(cur)
+            elif g > rhs:
+                self.g[cur] = rhs
+                for n in self.neighbours(cur):
+                    self.update_vertex(n)
+            else:
+                self.g[cur] = INF
+                self.update_vertex(cur)
+                for n in self.neighbours(cur):
+                    self.update_vertex(n)
+
+    def move_start(self, start):
+        self.km += self.heuristic(self.start, start)
+        self.start = start
+
+    def update_cells(self, changes):
+        """
+        Apply {cell: block} changes. Stepping onto a cell is what costs, so the cells whose
+        distances can change are its neighbours.
+        """
+        for cell, block in changes.items():
+            self.grid[cell] = block
+            self.costs[cell] = self.step_cost(block)
+            for n in self.neighbours(cell):
+                self.update_vertex(n)
+
+    def update_grid(self, grid):
+        """
+        update_cells with every cell where grid differs from the last one seen.
+        """
+        self.update_cells({i: block for i, (old, block) in enumerate(zip(self.grid, grid)) if old != block})
+
+    def distance(self):
+        self.compute()
+        distance = self.g.get(self.start, INF)
+        return None if distance == INF else distance // self.scale
+
+    def shortest_path(self):
+        """
+        Cell indexes from start to end, [] when end cannot be reached.
+        """
+        if self.distance() is None:
+            return []
+        result = [self.start]
+        cur = self.start
+        while cur != self.end:
+            cur = min((n for n in self.neighbours(cur) if self.costs[n] is not None),
+                      key=lambda n: self.costs[n] + self.g.get(n, INF))
+            result.append(cur)
+        return result
+
+
+def calc_reward(grid, path_list):
+    reward = 0
+    for g in path_list:
+        if grid[g] == "soul_sand":
+            reward -= 4
+        if grid[g] == "stone":
+            reward -= 1
+    return reward
+
+
+def extract_action_list_from_path(path_list, width=81):
+    action_trans = {-width: 'movenorth 1', width: 'movesouth 1', -1: 'movewest 1', 1: 'moveeast 1'}
+    alist = []
+    for i in range(len(path_list) - 1):
+        curr_block, next_block = path_list[i:(i + 2)]
+        alist.append(action_trans[next_block - curr_block])
+    return alist
@@ -0,0 +1,120 @@
+import argparse, json, os
+import numpy as np
+
+
+class CompiledPolicy:
+    """
+    The greedy action of every state of a discrete env, as a uint8 array.
+
+    tie_mask[state] has bit a set for every action a within atol of the best value, so a
+    runtime can still tell where the compiled choice was arbitrary. metadata records how
+    ties were broken, how many states had them and how many had no preference at all,
+    e.g. Q-table rows that were never updated.
+    """
+
+    def __init__(self, actions, tie_mask, metadata):
+        self.actions = actions
+        self.tie_mask = tie_mask
+        self.metadata = metadata
+
+    def save(self, path):
+        np.savez(path, actions=self.actions, tie_mask=self.tie_mask, metadata=json.dumps(self.metadata))
+
+
+def compileScores(scores, tie_break="first", atol=0.0, seed=None, source="scores"):
+    """
+    Compile a (state_num, action_num) array of action values or logits. tie_break "first"
+    keeps the lowest tied action like np.argmax, "random" draws one of the tied actions.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    state_num, action_num = scores.shape
+    assert action_num <= 64, "Tie Mask Does Not Fit In uint64"
+
+    tied = scores >= scores.max(axis=1, keepdims=True) - atol
+    if tie_break == "first":
+        actions = tied.argmax(axis=1)
+    elif tie_break == "random":
+        # Among the tied actions, the one with the highest random key wins
+        keys = np.random.default_rng(seed).random(scores.shape) * tied
+        actions = keys.argmax(axis=1)
+    else:
+        raise ValueError(f"Unknown tie_break {tie_break!r}")
+
+    mask_type = np.min_scalar_type((1 << action_num) - 1)
+    weights = np.array([1 << a for a in range(action_num)], dtype=mask_type)
+    tie_mask = (tied.astype(mask_type) * weights).sum(axis=1).astype(mask_type)
+
+    tie_counts = tied.sum(axis=1)
+    metadata = {
+        "source": source,
+        "state_num": int(state_num),
+        "action_num": int(action_num),
+        "tie_break": tie_break,
+        "atol": atol,
+        "seed": seed,
+        "tied_states": int((tie_counts > 1).sum()),
+        "indifferent_states": int((tie_counts == action_num).sum()),
+    }
+    return CompiledPolicy(actions.astype(np.uint8), tie_mask, metadata)
+
+
+def compileAgent(agent, state_num, **kwargs):
+    """
+    Compile a TrainingRunner Agent from its action values over states 0 .. state_num - 1.
+    """
+    return compileScores(agent.actionValues(np.arange(state_num)), source=type(agent).__name__, **kwargs)
+
+
+def compileRLlibPolicy(policy, observations, batch_size=1024, **kwargs):
+    """
+    Compile an RLlib policy over an enumeration of its observations, state i being
+    observations[i]. Uses the action distribution inputs, the logits for a PPO policy.
+    """
+    logits = []
+    for start in range(0, len(observations), batch_size):
+        _, _, info = policy.compute_actions(observations[start:start + batch_size], explore=False)
+        logits.append(np.asarray(info["action_dist_inputs"]))
+    return compileScores(np.concatenate(logits), source=type(policy).__name__, **kwargs)
+
+
+class PolicyTable:
+    """
+    Runtime for a compiled policy: selectAction is one list index, only numpy is needed
+    to load it.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.actions = data["actions"]
+            self.tie_mask = data["tie_mask"]
+            self.metadata = json.loads(str(data["metadata"]))
+        self.lookup = self.actions.tolist()
+
+    def selectAction(self, state):
+        return self.lookup[state]
+
+    def tiedActions(self, state):
+        mask = int(self.tie_mask[state])
+        return [a for a in range(self.metadata["action_num"]) if mask >> a & 1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile a saved Q-table (.npy) or DQN (.pt) to a policy table")
+    parser.add_argument("checkpoint", type=str)
+    parser.add_argument("--output", type=str, default=None, help="defaults to the checkpoint path with .policy.npz")
+    parser.add_argument("--state_num", type=int, default=500, help="states to evaluate a DQN over")
+    parser.add_argument("--tie_break", type=str, choices=["first", "random"], default="first")
+    parser.add_argument("--atol", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    config = parser.parse_args()
+
+    options = dict(tie_break=config.tie_break, atol=config.atol, seed=config.seed)
+    if config.checkpoint.endswith(".pt"):
+        import torch
+        policy = compileAgent(torch.load(config.checkpoint, weights_only=False), config.state_num, **options)
+    else:
+        policy = compileScores(np.load(config.checkpoint), source="q_table", **options)
+
+    output = config.output or os.path.splitext(config.checkpoint)[0] + ".policy.npz"
+    policy.save(output)
+    print(f"{output}: {policy.metadata}")
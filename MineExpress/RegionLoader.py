@@ -0,0 +1,165 @@
+import hashlib, os, struct, tempfile, zlib, gzip
+import numpy as np
+
+# Numeric block ids of the pre-1.13 worlds Malmo runs
+BLOCK_IDS = {"air": 0, "stone": 1, "grass": 2, "bedrock": 7, "chest": 54, "soul_sand": 88, "emerald_block": 133,
+             "redstone_block": 152}
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "MineExpressWorldCache")
+
+SECTOR = 4096
+
+
+def readNBT(data):
+    """
+    Parse an uncompressed NBT blob into dicts, lists, numbers and strings. Byte, int and
+    long arrays come back as numpy views on data.
+    """
+    pos = 0
+    scalars = {1: ">b", 2: ">h", 3: ">i", 4: ">q", 5: ">f", 6: ">d"}
+    arrays = {7: np.uint8, 11: ">i4", 12: ">i8"}
+
+    def unpack(fmt):
+        nonlocal pos
+        value, = struct.unpack_from(fmt, data, pos)
+        pos += struct.calcsize(fmt)
+        return value
+
+    def string():
+        nonlocal pos
+        length = unpack(">H")
+        value = data[pos:pos + length].decode("utf-8")
+        pos += length
+        return value
+
+    def payload(tag):
+        nonlocal pos
+        if tag in scalars:
+            return unpack(scalars[tag])
+        if tag in arrays:
+            length = unpack(">i")
+            value = np.frombuffer(data, arrays[tag], length, pos)
+            pos += value.nbytes
+            return value
+        if tag == 8:
+            return string()
+        if tag == 9:
+            item = unpack(">b")
+            return [payload(item) for _ in range(unpack(">i"))]
+        if tag == 10:
+            compound = {}
+            while True:
+                item = unpack(">b")
+                if item == 0:
+                    return compound
+                name = string()
+                compound[name] = payload(item)
+        raise ValueError(f"Unknown NBT tag {tag}")
+
+    tag = unpack(">b")
+    string()
+    return payload(tag)
+
+
+class RegionFile:
+    """
+    One Anvil r.<x>.<z>.mca file. Only the 4 KiB location header is read up front, chunks
+    are read and decompressed one at a time on demand.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.locations = np.frombuffer(self.file.read(SECTOR), ">u4")
+
+    def readChunk(self, cx, cz):
+        """
+        The NBT of chunk (cx, cz), in world chunk coordinates, or None if it was never generated.
+        """
+        location = int(self.locations[(cx & 31) + (cz & 31) * 32])
+        if location == 0:
+            return None
+        self.file.seek((location >> 8) * SECTOR)
+        length, compression = struct.unpack(">iB", self.file.read(5))
+        data = self.file.read(length - 1)
+        return readNBT(zlib.decompress(data) if compression == 2 else gzip.decompress(data))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def readLayer(world_dir, x1, x2, z1, z2, y):
+    """
+    Block ids of the y layer over x1..x2 and z1..z2 (inclusive), indexed [x - x1, z - z1].
+    Only the chunks covering the area are decompressed. Missing chunks read as air.
+    """
+    blocks = np.zeros((x2 - x1 + 1, z2 - z1 + 1), dtype=np.uint16)
+    chunks = [(cx, cz) for cx in range(x1 >> 4, (x2 >> 4) + 1) for cz in range(z1 >> 4, (z2 >> 4) + 1)]
+    regions = sorted({(cx >> 5, cz >> 5) for cx, cz in chunks})
+
+    for rx, rz in regions:
+        path = os.path.join(world_dir, "region", f"r.{rx}.{rz}.mca")
+        if not os.path.exists(path):
+            continue
+        with RegionFile(path) as region:
+            for cx, cz in chunks:
+                if (cx >> 5, cz >> 5) != (rx, rz):
+                    continue
+                chunk = region.readChunk(cx, cz)
+                if chunk is None:
+                    continue
+                section = [s for s in chunk["Level"]["Sections"] if s["Y"] == y >> 4]
+                if not section:
+                    continue
+                section = section[0]
+                assert "Blocks" in section, "Only Worlds With Numeric Block Ids (Before 1.13) Are Supported"
+
+                # Section arrays are indexed y * 256 + z * 16 + x
+                layer = section["Blocks"].reshape(16, 16, 16)[y & 15].astype(np.uint16)
+                if "Add" in section:
+                    add = section["Add"].reshape(16, 16, 8)[y & 15]
+                    layer |= (np.stack([add & 0xF, add >> 4], axis=-1).reshape(16, 16).astype(np.uint16) << 8)
+                layer = layer.T
+
+                # Overlap of the chunk with the requested area
+                ax1, az1 = max(x1, cx * 16), max(z1, cz * 16)
+                ax2, az2 = min(x2, cx * 16 + 15), min(z2, cz * 16 + 15)
+                blocks[ax1 - x1:ax2 - x1 + 1, az1 - z1:az2 - z1 + 1] = \
+                    layer[ax1 - cx * 16:ax2 - cx * 16 + 1, az1 - cz * 16:az2 - cz * 16 + 1]
+    return blocks
+
+
+def loadLayer(world_dir, x1, x2, z1, z2, y, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    readLayer behind a disk cache. Entries are keyed by the world path, the area and the
+    mtime and size of the region files read, so editing the world invalidates them.
+    cache_dir=None always reads the world.
+    """
+    if cache_dir is None:
+        return readLayer(world_dir, x1, x2, z1, z2, y)
+
+    regions = sorted({(cx >> 5, cz >> 5) for cx in range(x1 >> 4, (x2 >> 4) + 1)
+                      for cz in range(z1 >> 4, (z2 >> 4) + 1)})
+    stamps = []
+    for rx, rz in regions:
+        path = os.path.join(world_dir, "region", f"r.{rx}.{rz}.mca")
+        stat = os.stat(path) if os.path.exists(path) else None
+        stamps.append((rx, rz, stat and stat.st_mtime_ns, stat and stat.st_size))
+    key = hashlib.sha1(repr((os.path.abspath(world_dir), x1, x2, z1, z2, y, stamps)).encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, f"layer-{key}.npy")
+
+    if os.path.exists(cache_path):
+        return np.load(cache_path)
+
+    blocks = readLayer(world_dir, x1, x2, z1, z2, y)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, blocks)
+    os.replace(tmp_path, cache_path)
+    return blocks
@@ -0,0 +1,90 @@
+import os, time, warnings
+import multiprocessing
+import torch
+
+
+def addRuntimeArguments(parser):
+    """
+    CPU runtime flags of the torch learners. The defaults suit tiny nets packed many runs
+    to a machine: one intra-op and one inter-op thread per process.
+    """
+    parser.add_argument("--intra_op_threads", type=int, default=1, help="0 keeps torch's default")
+    parser.add_argument("--inter_op_threads", type=int, default=1, help="0 keeps torch's default")
+    parser.add_argument("--cores_per_worker", type=int, default=1, help="cores each pool worker is pinned to")
+    parser.add_argument("--auto_batch_size", action="store_true",
+                        help="pick batch_size from a micro-benchmark at startup")
+    parser.add_argument("--batch_size_candidates", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    return parser
+
+
+def configureThreads(intra_op=1, inter_op=1):
+    """
+    Set torch's thread pools for this process, 0 keeps a default. The inter-op pool can only
+    be sized before torch first uses it, later calls warn and leave it as it is. The OpenMP
+    and MKL variables are set too, for processes started from this one.
+    """
+    if intra_op:
+        torch.set_num_threads(intra_op)
+        os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = str(intra_op)
+    if inter_op and torch.get_num_interop_threads() != inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            warnings.warn(f"Could not set inter-op threads: {e}")
+
+
+def pinWorker(index=None, cores_per_worker=1):
+    """
+    Pin this process to cores_per_worker of the cores it may run on, the index-th group of
+    them round robin. index defaults to the process's number in its multiprocessing pool.
+    Returns the cores, or None where affinity is not supported.
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+    if index is None:
+        identity = multiprocessing.current_process()._identity
+        index = identity[-1] - 1 if identity else 0
+    available = sorted(os.sched_getaffinity(0))
+    first = index * cores_per_worker
+    cores = {available[(first + i) % len(available)] for i in range(min(cores_per_worker, len(available)))}
+    os.sched_setaffinity(0, cores)
+    return cores
+
+
+def initWorker(intra_op=1, inter_op=1, cores_per_worker=1):
+    """
+    Pool initializer, e.g. ProcessPoolExecutor(initializer=initWorker, initargs=(1, 1, 1)).
+    """
+    pinWorker(cores_per_worker=cores_per_worker)
+    configureThreads(intra_op, inter_op)
+
+
+def applyRuntime(config):
+    configureThreads(config.intra_op_threads, config.inter_op_threads)
+
+
+def pickBatchSize(step, candidates, tolerance=1.25, seconds=0.5, rounds=10):
+    """
+    Time step(batch_size) for every candidate and return the largest batch size whose step
+    takes at most tolerance times the fastest one, i.e. the most samples per call that still
+    come nearly for free on this machine and thread setting. The benchmark takes about
+    seconds, in rounds that each time every candidate once, and keeps each candidate's best
+    round, so neither a slow start nor a noisy neighbour decides. Also returns the seconds
+    per step of each candidate.
+    """
+    candidates = sorted(candidates)
+    for batch_size in candidates:
+        for _ in range(3):
+            step(batch_size)
+    timings = dict.fromkeys(candidates, float("inf"))
+    slice_seconds = seconds / (rounds * len(candidates))
+    for _ in range(rounds):
+        for batch_size in candidates:
+            calls, start = 0, time.perf_counter()
+            while time.perf_counter() - start < slice_seconds:
+                step(batch_size)
+                calls += 1
+            timings[batch_size] = min(timings[batch_size], (time.perf_counter() - start) / calls)
+    fastest = min(timings.values())
+    chosen = max(size for size, seconds in timings.items() if seconds <= tolerance * fastest)
+    return chosen, timings
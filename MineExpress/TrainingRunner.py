@@ -0,0 +1,264 @@
+import argparse, os, time
+from abc import ABC, abstractmethod
+import numpy as np
+from gym.spaces import Discrete
+from tqdm import tqdm
+from MetricsUtils import EpisodeMetricsWriter, BatchedSummaryWriter
+from PolicyCompiler import compileAgent
+
+
+def getArgumentParser(**defaults):
+    """
+    Arguments shared by every MineExpress learner, scripts add their own on top and may
+    override the defaults, e.g. getArgumentParser(total_episodes=1000, seed=None).
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--total_episodes", type=int, default=5000)
+    parser.add_argument("--total_steps", type=int, default=100)
+    parser.add_argument("--learning_rate", type=float, default=0.7)
+    parser.add_argument("--gamma", type=float, default=0.618)
+    parser.add_argument("--epsilon", type=float, default=1)
+    parser.add_argument("--max_epsilon", type=float, default=1)
+    parser.add_argument("--min_epsilon", type=float, default=0.3)
+    parser.add_argument("--decay_rate", type=float, default=0.001)
+    parser.add_argument("--save-model-interval", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num_envs", type=int, default=1, help="envs stepped together by runBatch")
+    parser.add_argument("--verbose", action="store_true")
+    parser.set_defaults(**defaults)
+    return parser
+
+
+class Agent(ABC):
+    """
+    What TrainingRunner needs from a learner.
+
+        selectAction(state): greedy action for state
+        actionValues(states): (len(states), action_num) values, for PolicyCompiler
+        update(state, action, reward, new_state, done): learn from one transition, agents
+            that do not learn keep the default that ignores it
+        save(path): write a checkpoint, path has no extension
+    """
+
+    @abstractmethod
+    def selectAction(self, state):
+        pass
+
+    @abstractmethod
+    def actionValues(self, states):
+        pass
+
+    def update(self, state, action, reward, new_state, done):
+        pass
+
+    @abstractmethod
+    def save(self, path):
+        pass
+
+
+class QTableAgent(Agent):
+
+    def __init__(self, state_num, action_num, learning_rate, gamma):
+        self.q_table = np.zeros((state_num, action_num))
+        self.learning_rate = learning_rate
+        self.gamma = gamma
+
+    def selectAction(self, state):
+        return np.argmax(self.q_table[state, :])
+
+    def actionValues(self, states):
+        return self.q_table[states]
+
+    def update(self, state, action, reward, new_state, done):
+        self.q_table[state, action] += self.learning_rate * (
+                reward + self.gamma * np.max(self.q_table[new_state, :]) - self.q_table[state, action])
+
+    def save(self, path):
+        np.save(path, self.q_table)
+
+
+class TrainingRunner:
+    """
+    Epsilon-greedy training loop shared by every learner.
+
+    Owns the run directory under runs/{current_time}, the epsilon schedule, the running
+    reward, checkpointing every save_model_interval episodes and the metrics writers.
+    Training ends with the greedy policy compiled to model/policy.npz for PolicyTable.
+    The exploration draws of an episode are sampled in one batch up front instead of one
+    random call and one action_space.sample() per step.
+
+    With root=None nothing is written to disk, which is what sweeps use for their trials.
+    run() steps env one episode at a time, runBatch() steps a vectorized env.
+    """
+
+    def __init__(self, env, agent, config, root="runs"):
+        self.env = env
+        self.agent = agent
+        self.config = config
+
+        self.run_dir = None
+        self.writer = None
+        self.metrics = None
+        if root is not None:
+            current_time = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(time.time()))
+            self.run_dir = os.path.join(root, current_time)
+            os.makedirs(os.path.join(self.run_dir, "data"), exist_ok=True)
+            os.makedirs(os.path.join(self.run_dir, "model"), exist_ok=True)
+
+            self.writer = BatchedSummaryWriter(os.path.join(self.run_dir, "data"))
+            self.metrics = EpisodeMetricsWriter(os.path.join(self.run_dir, "data", "episodes"))
+
+        # Exploration gets its own stream, independent of the env seeded with the same seed
+        self.rng = np.random.default_rng(np.random.SeedSequence(config.seed).spawn(1)[0])
+
+        self.epsilon = config.epsilon
+        self.running_reward = 10.0
+        self.total_reward = 0
+
+    def getEpsilon(self, episode):
+        config = self.config
+        return config.min_epsilon + (config.max_epsilon - config.min_epsilon) * np.exp(-config.decay_rate * episode)
+
+    def runEpisode(self):
+        state = self.env.reset()
+        ep_reward = 0
+        status = 0
+
+        explore = self.rng.uniform(0, 1, self.config.total_steps) <= self.epsilon
+        random_actions = self.rng.integers(0, self.env.action_space.n, self.config.total_steps)
+
+        for step in range(self.config.total_steps):
+            action = random_actions[step] if explore[step] else self.agent.selectAction(state)
+
+            new_state, reward, done, info = self.env.step(action)
+
+            self.agent.update(state, action, reward, new_state, done)
+
+            ep_reward += reward
+
+            if self.config.verbose:
+                tqdm.write(f"Step:{step}, Reward: {reward}, State {state}, Action: {info}")
+
+            state = new_state
+
+            if reward == 0:
+                status = 1
+
+            if done:
+                status = 2
+                if self.config.verbose:
+                    tqdm.write("Mission Success!")
+                break
+
+        return ep_reward, status
+
+    def run(self, stop=None, start=0):
+        """
+        Train for total_episodes, or until stop(episode, running_reward) returns True.
+        start continues a run without a run directory that stopped before episode start,
+        e.g. a sweep's at the end of a rung. Returns the number of episodes run.
+        """
+        episode = start - 1
+        for episode in tqdm(range(start, self.config.total_episodes), ascii=True, desc="Episode Progress",
+                            position=0, ncols=100, disable=self.run_dir is None):
+
+            self.checkpoint(episode)
+
+            ep_reward, status = self.runEpisode()
+            self.endEpisode(episode, ep_reward, status)
+
+            if stop is not None and stop(episode, self.running_reward):
+                break
+
+        self.finish()
+        return episode + 1
+
+    def runBatch(self, stop=None):
+        """
+        run() over a vectorized env, e.g. a SubprocVecEnv, whose num_envs envs are stepped
+        together. Every step draws the exploration of all envs at once, asks the agent for
+        the greedy actions of the batch through actionValues and feeds it each env's
+        transition. Episodes end per env, at done or after total_steps, and are booked in the
+        order they finish; the env then starts its next episode. Episodes still running when
+        training ends are dropped. The agent sees the envs' transitions interleaved, one env
+        after the other, so consecutive updates are not one trajectory. Returns the number of
+        episodes run.
+        """
+        env, num_envs = self.env, self.env.num_envs
+        states = env.reset()
+        ep_rewards = np.zeros(num_envs)
+        statuses = np.zeros(num_envs, dtype=np.int64)
+        steps = np.zeros(num_envs, dtype=np.int64)
+
+        episode = 0
+        progress = tqdm(total=self.config.total_episodes, ascii=True, desc="Episode Progress", position=0, ncols=100,
+                        disable=self.run_dir is None)
+        while episode < self.config.total_episodes:
+            explore = self.rng.uniform(0, 1, num_envs) <= self.epsilon
+            actions = self.rng.integers(0, env.action_space.n, num_envs)
+            if not explore.all():
+                greedy = ~explore
+                actions[greedy] = np.argmax(self.agent.actionValues(states[greedy]), axis=1)
+
+            new_states, rewards, dones, infos = env.step(actions)
+            steps += 1
+            ep_rewards += rewards
+            statuses[rewards == 0] = np.maximum(statuses[rewards == 0], 1)
+            statuses[dones] = 2
+
+            for i in range(num_envs):
+                # Finished envs are already reset, the transition ends in the terminal observation
+                new_state = infos[i]["terminal_observation"] if dones[i] else new_states[i]
+                self.agent.update(states[i], actions[i], rewards[i], new_state, dones[i])
+
+            finished = dones | (steps >= self.config.total_steps)
+            truncated = np.flatnonzero(finished & ~dones)
+            if len(truncated):
+                new_states[truncated] = env.resetEnvs(truncated)
+            states = new_states
+
+            stopped = False
+            for i in np.flatnonzero(finished):
+                self.endEpisode(episode, ep_rewards[i], statuses[i])
+                episode += 1
+                progress.update(1)
+                stopped = stop is not None and stop(episode - 1, self.running_reward)
+                if stopped or episode == self.config.total_episodes:
+                    break
+                self.checkpoint(episode)
+            ep_rewards[finished] = 0
+            statuses[finished] = 0
+            steps[finished] = 0
+            if stopped:
+                break
+
+        progress.close()
+        self.finish()
+        return episode
+
+    def checkpoint(self, episode):
+        # Saved before episode starts, i.e. once episode episodes are done
+        if episode % self.config.save_model_interval == 0 and episode > 0 and self.run_dir is not None:
+            self.agent.save(os.path.join(self.run_dir, "model", f"episode-{episode}"))
+
+    def endEpisode(self, episode, ep_reward, status):
+        self.total_reward += ep_reward
+
+        self.epsilon = self.getEpsilon(episode)
+
+        self.running_reward = 0.05 * ep_reward + (1 - 0.05) * self.running_reward
+        if self.writer is not None:
+            self.writer.add_scalar("Running Reward", self.running_reward, episode)
+            self.writer.add_scalar("Episode Reward", ep_reward, episode)
+            self.metrics.append(episode, ep_reward, status)
+        if self.config.verbose:
+            tqdm.write(
+                f"Episode {episode}\tLast reward: {ep_reward:.2f}\tAverage reward: {self.running_reward:.2f}"
+            )
+
+    def finish(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.metrics.close()
+        if self.run_dir is not None and isinstance(self.env.observation_space, Discrete):
+            compileAgent(self.agent, self.env.observation_space.n).save(os.path.join(self.run_dir, "model", "policy"))